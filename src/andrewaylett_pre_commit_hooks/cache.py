@@ -0,0 +1,127 @@
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from andrewaylett_pre_commit_hooks import logger
+
+# Default upper bound on the total size of a single cache directory
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Entries kept in memory for each cache directory, when enabled
+_memory: dict[Path, dict[str, bytes]] | None = None
+
+
+def keep_in_memory() -> None:
+    """Keep every cache entry read or written by this process in memory.
+
+    This is for long-lived processes. Entries are still read from and written
+    to disk, but an entry that's been seen once won't be read from disk again.
+    """
+    global _memory
+    if _memory is None:
+        _memory = {}
+
+
+def cache_dir(name: str) -> Path:
+    """Return the directory for a named cache.
+
+    Caches live under `$XDG_CACHE_HOME`, falling back to `~/.cache`.
+
+    Args:
+        name: Name of the cache, used as a subdirectory
+
+    Returns:
+        Path to the cache directory, which may not exist yet
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return Path(base) / "andrewaylett-pre-commit-hooks" / name
+
+
+class DiskCache:
+    """A size-bounded on-disk key/value store.
+
+    Each entry is a file named after its key. Reading an entry refreshes its
+    modification time, and `evict` removes the least recently used entries
+    until the cache fits within its size limit.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        directory: Path | None = None,
+    ):
+        self.directory = directory or cache_dir(name)
+        self.max_bytes = max_bytes
+        self._memory = (
+            None if _memory is None else _memory.setdefault(self.directory, {})
+        )
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key
+
+    def get(self, key: str) -> bytes | None:
+        """Return the value stored for key, or None if there isn't one."""
+        if self._memory is not None and key in self._memory:
+            return self._memory[key]
+        path = self._path(key)
+        try:
+            value = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            return None
+        if self._memory is not None:
+            self._memory[key] = value
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        """Store value under key, replacing any existing entry atomically."""
+        if self._memory is not None:
+            self._memory[key] = value
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+            os.replace(temp_path, self._path(key))
+        except OSError as e:
+            # A cache that can't be written is not an error, just slower
+            logger.debug(f"Could not write cache entry {key}: {e}")
+
+    def evict(self, max_age: float | None = None) -> int:
+        """Remove least recently used entries until the cache fits its limit.
+
+        Args:
+            max_age: If given, also remove every entry that hasn't been used for
+                this many seconds
+
+        Returns:
+            The number of entries removed
+        """
+        try:
+            entries = [
+                (entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+                for entry in os.scandir(self.directory)
+                if entry.is_file()
+            ]
+        except OSError:
+            return 0
+
+        cutoff = None if max_age is None else time.time_ns() - int(max_age * 1e9)
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes and (cutoff is None or mtime >= cutoff):
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            if self._memory is not None:
+                self._memory.pop(os.path.basename(path), None)
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,103 @@
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+from typing import TypedDict
+
+from cogapp.cogapp import CogOptions
+from cogapp.hashhandler import HashHandler
+
+from andrewaylett_pre_commit_hooks import error_logger, logger
+
+
+class Mismatch(TypedDict):
+    file: str
+    line: int
+    reason: str
+
+
+def verify_file(file: str) -> list[Mismatch]:
+    """Check the checksum of every generated block in a file.
+
+    The file is streamed line by line, and no generator code is run. A block
+    fails if its checksum doesn't match its output, or if it has no checksum.
+
+    Args:
+        file: Path to the file to check
+
+    Returns:
+        A mismatch for each block that failed, reported at its end marker line
+    """
+    options = CogOptions()
+    hash_handler = HashHandler(options.end_output)
+    mismatches: list[Mismatch] = []
+
+    def mismatch(line: int, reason: str) -> None:
+        mismatches.append(Mismatch(file=file, line=line, reason=reason))
+
+    try:
+        with open(file, encoding=options.encoding) as f:
+            in_code = in_output = False
+            hasher = hashlib.md5(usedforsecurity=False)
+            line_number = 0
+            for line_number, line in enumerate(f, start=1):
+                is_end_output = options.end_output in line
+                is_end_spec = options.end_spec in line and not is_end_output
+                if in_output:
+                    if is_end_output:
+                        in_output = False
+                        kind, found = hash_handler.extract_hash_from_line(line)
+                        expected = hasher.hexdigest()
+                        if kind == "base64":
+                            expected = hash_handler.hex_to_base64_hash(expected)
+                        if kind is None:
+                            mismatch(line_number, "missing checksum")
+                        elif found != expected:
+                            mismatch(line_number, "checksum mismatch")
+                    elif options.begin_spec in line or is_end_spec:
+                        mismatch(line_number, "malformed block")
+                        return mismatches
+                    else:
+                        hasher.update(line.encode("utf-8"))
+                elif in_code:
+                    if is_end_spec:
+                        in_code = False
+                        in_output = True
+                        hasher = hashlib.md5(usedforsecurity=False)
+                elif options.begin_spec in line:
+                    if is_end_spec:
+                        in_output = True
+                        hasher = hashlib.md5(usedforsecurity=False)
+                    else:
+                        in_code = True
+            if in_code or in_output:
+                mismatch(line_number, "malformed block")
+    except (OSError, UnicodeDecodeError) as e:
+        mismatch(0, f"unreadable: {e}")
+    return mismatches
+
+
+def verify_files(files: set[str], jobs: int = 1) -> bool:
+    """Check the checksums in a set of files without running any generators.
+
+    Each failing block is printed to stdout as a JSON object on its own line,
+    in filename order.
+
+    Returns:
+        True if every block's checksum matched, False otherwise
+    """
+    ordered = sorted(files)
+    logger.info(f"Verifying checksums in {len(ordered)} files...")
+
+    if jobs > 1 and len(ordered) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(ordered))) as pool:
+            results = list(pool.map(verify_file, ordered))
+    else:
+        results = [verify_file(file) for file in ordered]
+
+    mismatches = [mismatch for result in results for mismatch in result]
+    for mismatch in mismatches:
+        print(json.dumps(mismatch))
+    if mismatches:
+        error_logger.error(f"Error: {len(mismatches)} generated blocks failed checks")
+        return False
+    return True
@@ -1,40 +1,246 @@
+import argparse
+import hashlib
+import io
+import json
+import mmap
 import os
+import re
+import shutil
 import sys
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from typing import Any, TextIO, TypedDict
 
+import cogapp.cogapp
 from cogapp import Cog
+from cogapp.cogapp import CogError, CogGenerator
+from cogapp.cogapp import __version__ as cog_version
 
 from andrewaylett_pre_commit_hooks import error_logger, logger
+from andrewaylett_pre_commit_hooks.cache import DEFAULT_MAX_BYTES, DiskCache
+from andrewaylett_pre_commit_hooks.checksums import verify_files
+from andrewaylett_pre_commit_hooks.dependencies import (
+    Dependencies,
+    is_current,
+    paused,
+    record,
+    recording,
+    repository_state,
+    snapshot,
+)
+from andrewaylett_pre_commit_hooks.file_index import (
+    compile_pattern,
+    is_pattern,
+    list_repository_files,
+    resolve_entries,
+    tree_state,
+)
+from andrewaylett_pre_commit_hooks.generator_helpers import (
+    LazyModule,
+    MemoizedSubprocess,
+    ParallelRunner,
+    RepositoryFacts,
+)
+from andrewaylett_pre_commit_hooks.timing import (
+    DurationHistory,
+    Timing,
+    report_timings,
+    timed,
+)
 
+# Bump this whenever a change to the hook could change cog's output
+CACHE_VERSION = "2"
 
-def find_cog_files() -> set[str]:
+# Generators declare the files they read with `cog-depends: PATH ...`
+DEPENDS_RE = re.compile(rb"cog-depends:([^\n]*)")
+# Comment terminators that may follow a declaration on the same line
+DEPENDS_IGNORED = frozenset({"]]]", "-->", "*/"})
+
+# Files at least this large are streamed rather than read into memory
+DEFAULT_STREAM_THRESHOLD = 32 * 1024 * 1024
+# How much text to compare at a time when checking whether a file has changed
+COMPARE_CHUNK = 64 * 1024
+
+# Duration histories are small, one per directory cog is run in
+DURATIONS_MAX_BYTES = 1024 * 1024
+# Generators using these parts of the cog module depend on which file they're in
+FILE_SPECIFIC_RE = re.compile(r"\b(inFile|outFile|firstLineNum|previous)\b")
+
+
+@dataclass
+class CogSettings:
+    """How the hook configures each Cog instance it creates, and reports on them."""
+
+    memoize_subprocess: bool = False
+    subprocess_ttl: float = 0
+    dedupe: bool = False
+    # Directory in which deduplicated block results are shared between workers
+    dedupe_dir: str | None = None
+    slowest: int = 0
+    timing_report: str | None = None
+    block_budget: float | None = None
+    # Extra globals for generators, mapping each name to the module it imports
+    define_modules: dict[str, str] = field(default_factory=dict)
+    # How many commands cog_parallel runs at once, or None for one per CPU
+    parallel_limit: int | None = None
+    # How long each command run by cog_parallel may take, in seconds
+    parallel_timeout: float | None = None
+    # Reuse repository facts from earlier runs while their inputs are unchanged
+    persist_repo_facts: bool = False
+    # Directory in which repository facts are shared between workers
+    repo_facts_dir: str | None = None
+    # Only rerun blocks whose source, output or inputs changed since the last run
+    incremental: bool = False
+    # Write a JSON manifest of what changed to this path
+    manifest: str | None = None
+    # Files of at least this many bytes are streamed, or None to never stream
+    stream_threshold: int | None = DEFAULT_STREAM_THRESHOLD
+
+
+@dataclass
+class FileResult:
+    """The outcome of running cog over a single file."""
+
+    file: str
+    output: str = ""
+    error: str | None = None
+    dependencies: Dependencies | None = None
+    stats: Counter[str] = field(default_factory=Counter)
+    timing: Timing | None = None
+    blocks: list[Timing] = field(default_factory=list)
+    # Whether cog rewrote the file
+    changed: bool = False
+    # The first and last lines of each block whose output changed, in the new
+    # file, covering the output and its end marker
+    changed_blocks: list[tuple[int, int]] = field(default_factory=list)
+    # The first line of each block that was skipped by --incremental
+    skipped_blocks: list[int] = field(default_factory=list)
+
+
+def resolve_cogfiles(
+    entries: list[str],
+    cache: DiskCache | None = None,
+    directory: str = ".",
+    listing: list[str] | None = None,
+) -> set[str]:
+    """Resolve the entries of a `.cogfiles` file to a set of files.
+
+    Entries may be literal paths, globs (with `**` matching any number of
+    directories), directories ending in `/`, or `!`-prefixed excludes. Patterns
+    are matched against a single listing of the repository, and if a cache is
+    given the result is reused until the set of tracked files changes.
+
+    Args:
+        entries: The entries, relative to the `.cogfiles` file's directory
+        cache: Cache for resolved patterns
+        directory: The directory containing the `.cogfiles` file
+        listing: Every file in the repository, if already known
+
+    Returns:
+        The files, relative to the current directory
+    """
+
+    def rebase(path: str) -> str:
+        return os.path.normpath(os.path.join(directory, path)).replace(os.sep, "/")
+
+    if not any(is_pattern(entry, directory) for entry in entries):
+        return {rebase(entry) for entry in entries}
+
+    key = None
+    if cache is not None and (state := tree_state()) is not None:
+        key = hashlib.sha256(
+            "\0".join(["cogfiles", CACHE_VERSION, state, directory, *entries]).encode()
+        ).hexdigest()
+        if (cached := cache.get(key)) is not None:
+            return set(json.loads(cached))
+
+    if listing is None:
+        listing = list_repository_files()
+    prefix = "" if directory == "." else directory.rstrip("/") + "/"
+    local = [path.removeprefix(prefix) for path in listing if path.startswith(prefix)]
+    literals = {entry for entry in entries if not is_pattern(entry, directory)}
+    # Files matched by a pattern may be tracked but have been deleted
+    files = {
+        rebase(file)
+        for file in resolve_entries(entries, local, directory)
+        if file in literals or os.path.isfile(rebase(file))
+    }
+
+    if cache is not None and key is not None:
+        cache.put(key, json.dumps(sorted(files)).encode())
+    return files
+
+
+def read_cogfiles(path: str) -> list[str]:
+    """Read the entries of a `.cogfiles` file, exiting if there are none."""
+    with open(path) as f:
+        # Read the file list, strip whitespace, and filter out empty lines
+        entries = [line.strip() for line in f if line.strip()]
+    if not entries:
+        error_logger.error(f"Error: {path} exists but is empty")
+        sys.exit(1)
+    return entries
+
+
+def find_nested_cogfiles(
+    listing: list[str], cache: DiskCache | None = None
+) -> set[str]:
+    """Find files to process using every `.cogfiles` below the current directory.
+
+    Each `.cogfiles` file's entries are relative to its own directory. The
+    top-level `.cogfiles` isn't included.
+
+    Args:
+        listing: Every file in the repository, in which `.cogfiles` are found
+        cache: Cache for resolved patterns
+    """
+    files: set[str] = set()
+    for path in sorted(listing):
+        directory, name = os.path.split(path)
+        if name != ".cogfiles" or not directory or not os.path.isfile(path):
+            continue
+        logger.info(f"Using {path} to determine which files to process")
+        files |= resolve_cogfiles(read_cogfiles(path), cache, directory, listing)
+    return files
+
+
+def find_cog_files(cache: DiskCache | None = None, recursive: bool = False) -> set[str]:
     """Find files to process with cog.
 
     Looks for the first file that exists of `.cogfiles`, `README.md` or `README`.
-    - If `.cogfiles` exists, use it as a list of files to check
+    - If `.cogfiles` exists, use it as a list of files and patterns to check
     - If a README file exists, process just that file
     - If neither exists, exit with an error
+
+    If recursive, the files listed by `.cogfiles` in subdirectories are added.
     """
     try:
+        # One listing of the repository serves every .cogfiles
+        listing = list_repository_files() if recursive else None
+        nested = set() if listing is None else find_nested_cogfiles(listing, cache)
+
         # Check for .cogfiles first
         if os.path.exists(".cogfiles"):
             logger.info("Using .cogfiles to determine which files to process")
-            with open(".cogfiles") as f:
-                # Read the file list, strip whitespace, and filter out empty lines
-                files = {line.strip() for line in f if line.strip()}
-            if not files:
-                error_logger.error("Error: .cogfiles exists but is empty")
-                sys.exit(1)
-            return files
+            entries = read_cogfiles(".cogfiles")
+            return resolve_cogfiles(entries, cache, listing=listing) | nested
 
         # Check for README.md next
         elif os.path.exists("README.md"):
             logger.info("Processing README.md")
-            return {"README.md"}
+            return {"README.md"} | nested
 
         # Check for README last
         elif os.path.exists("README"):
             logger.info("Processing README")
-            return {"README"}
+            return {"README"} | nested
+
+        elif nested:
+            return nested
 
         # If none of the files exist, exit with an error
         else:
@@ -46,56 +252,954 @@ def find_cog_files() -> set[str]:
         sys.exit(1)
 
 
-def run_cog_on_files(files: set[str]) -> bool:
+def has_cog_markers(file: str, marker: bytes = b"[[[cog") -> bool:
+    """Check whether a file contains the cog begin marker.
+
+    The file is memory-mapped rather than read, so scanning large files without
+    any markers is cheap. Files that can't be read are reported as having
+    markers, so that cog gets the chance to report the problem.
+    """
+    try:
+        with open(file, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return False
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped.find(marker) != -1
+    except OSError:
+        return True
+
+
+def prescan_cog_files(files: set[str]) -> set[str]:
+    """Drop files without cog markers, logging how many were skipped."""
+    with_markers = {file for file in files if has_cog_markers(file)}
+    skipped = len(files) - len(with_markers)
+    if skipped:
+        logger.info(f"Skipping {skipped} files without cog markers")
+    return with_markers
+
+
+def declared_dependencies(file: str) -> list[str]:
+    """Return the paths and patterns a file's generators declare they depend on.
+
+    A generator declares its dependencies with a line containing `cog-depends:`
+    followed by paths or patterns relative to the repository root, usually in a
+    comment. Files that can't be read declare no dependencies.
+    """
+    try:
+        with open(file, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                declarations = [m.group(1) for m in DEPENDS_RE.finditer(mapped)]
+    except OSError:
+        return []
+    return [
+        token
+        for declaration in declarations
+        for token in os.fsdecode(declaration).split()
+        if token not in DEPENDS_IGNORED
+    ]
+
+
+def select_changed_files(files: set[str], changed: list[str]) -> set[str]:
+    """Select the cog files affected by a list of changed files.
+
+    A cog file is affected if it changed itself, or if one of its declared
+    dependencies did. If any `.cogfiles` changed, every file is affected.
+    """
+    changed_paths = {os.path.normpath(path) for path in changed}
+    if any(os.path.basename(path) == ".cogfiles" for path in changed_paths):
+        return files
+
+    selected = set()
+    for file in files:
+        if os.path.normpath(file) in changed_paths:
+            selected.add(file)
+            continue
+        for dependency in declared_dependencies(file):
+            regex = compile_pattern(dependency)
+            if any(regex.match(path) for path in changed_paths):
+                selected.add(file)
+                break
+    return selected
+
+
+def create_defines(settings: CogSettings | None = None) -> dict[str, object]:
+    """Return the globals made available to every cog generator.
+
+    Modules are only imported when a generator first uses them, so defines
+    that no generator needs cost nothing.
+    """
+    settings = settings or CogSettings()
+    subprocess: object = LazyModule("subprocess")
+    if settings.memoize_subprocess:
+        cache = DiskCache("subprocess") if settings.subprocess_ttl > 0 else None
+        subprocess = MemoizedSubprocess(cache, ttl=settings.subprocess_ttl)
+
+    # Equivalent to cog's -p option
+    defines = {
+        "subprocess": subprocess,
+        "sp": subprocess,
+        "re": LazyModule("re"),
+        "os": LazyModule("os"),
+        "sys": LazyModule("sys"),
+        "pathlib": LazyModule("pathlib"),
+        "pl": LazyModule("pathlib"),
+        "cog": LazyModule("cogapp"),
+        "cog_parallel": ParallelRunner(
+            subprocess, settings.parallel_limit, settings.parallel_timeout
+        ),
+    }
+    facts_cache = None
+    if settings.persist_repo_facts:
+        facts_cache = DiskCache("repo")
+    elif settings.repo_facts_dir is not None:
+        facts_cache = DiskCache("repo", directory=Path(settings.repo_facts_dir))
+    defines["repo"] = RepositoryFacts(facts_cache)
+    for name, module in settings.define_modules.items():
+        defines[name] = LazyModule(module)
+    return defines
+
+
+class _BlockResult(TypedDict):
+    """What running a generator block produced, for reuse by identical blocks."""
+
+    # None if the block deleted globals, which can't be replayed
+    output: str | None
+    dependencies: dict[str, Any]
+    globals: dict[str, Any]
+
+
+class _HookGenerator(CogGenerator):
+    """A generator that lets a HookCog take over evaluating it."""
+
+    def evaluate(self, cog: Any, globals: dict[str, Any], fname: str) -> str:
+        if isinstance(cog, HookCog):
+            return cog.evaluate_block(self, globals, fname)
+        return super().evaluate(cog, globals, fname)
+
+
+class HookCog(Cog):
+    """A Cog engine configured the way the hook runs it."""
+
+    def __init__(self, settings: CogSettings | None = None):
+        super().__init__()
+        self.settings = settings or CogSettings()
+
+        # Set options equivalent to command-line flags
+        self.options.replace = True  # -r: replace in-place
+        self.options.hash_output = True  # -c: checksum
+        self.options.verbosity = 3
+
+        # Add imports to globals (equivalent to -p option)
+        self.options.defines = create_defines(self.settings)
+
+        self.deduplicated = 0
+        self.block_timings: list[Timing] = []
+        self._block_results: dict[str, _BlockResult] = {}
+        self._shared_results = None
+        if self.settings.dedupe_dir is not None:
+            self._shared_results = DiskCache(
+                "dedupe", directory=Path(self.settings.dedupe_dir)
+            )
+        self._context = hashlib.sha256()
+
+        self.unchanged_blocks = 0
+        self.changed_blocks: list[tuple[int, int]] = []
+        self.skipped_blocks: list[int] = []
+        # How many lines earlier blocks in the file have added to it
+        self._line_shift = 0
+        self._block_cache = DiskCache("blocks") if self.settings.incremental else None
+        # Whether an earlier block in the file has assigned globals
+        self._stateful = False
+
+    def process_one_file(self, fname: str) -> None:
+        """Process a file in place, streaming it if it's large.
+
+        Cog reads the whole of a file into memory and builds the whole of its
+        output there too. Files of at least the stream threshold are instead
+        processed line by line into a temporary file, so only one generated
+        block at a time is held in memory.
+        """
+        threshold = self.settings.stream_threshold
+        try:
+            stream = threshold is not None and os.path.getsize(fname) >= threshold
+        except OSError:
+            stream = False
+        if not stream:
+            super().process_one_file(fname)
+            return
+
+        self.save_include_path()
+        try:
+            self.add_to_include_path(self.options.include_path)
+            self.add_to_include_path([os.path.dirname(fname)])
+            if self.options.verbosity >= 2:
+                self.prout(f"Cogging {fname}", end="")
+            changed = False
+            try:
+                changed = self._stream_file(fname)
+            finally:
+                if self.options.verbosity >= 2:
+                    self.prout("  (changed)" if changed else "")
+        finally:
+            self.restore_include_path()
+
+    def _open_temporary(self, fname: str) -> tuple[TextIO, str]:
+        """Open a temporary file that can atomically replace a file.
+
+        The temporary file is created alongside the file, or the file a symlink
+        points to, and is opened the way cog opens its output files.
+
+        Returns:
+            The open temporary file, and its path
+        """
+        target = os.path.realpath(fname)
+        fd, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(target),
+            prefix=f".{os.path.basename(target)}.",
+            suffix=".tmp",
+        )
+        newline = "\n" if self.options.newlines else None
+        return open(fd, "w", encoding=self.options.encoding, newline=newline), temp_path
+
+    def replace_file(self, old_path: str, new_text: str) -> None:
+        """Replace a file's content atomically, keeping its permissions.
+
+        Cog only calls this when the content has changed, so unchanged files
+        are never written to.
+        """
+        file_out, temp_path = self._open_temporary(old_path)
+        try:
+            with file_out:
+                file_out.write(new_text)
+            replace_atomically(temp_path, old_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    def _stream_file(self, fname: str) -> bool:
+        """Stream a file through cog, replacing it if the output differs.
+
+        Returns:
+            True if the file changed
+        """
+        file_out, temp_path = self._open_temporary(fname)
+        try:
+            with self.open_input_file(fname) as file_in, file_out:
+                self.process_file(file_in, file_out, fname)
+            with paused():
+                changed = not same_text(fname, temp_path, self.options.encoding)
+            if changed:
+                replace_atomically(temp_path, fname)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+        return changed
+
+    def process_file(self, file_in, file_out, fname=None, globals=None):
+        """Process a file, routing each generator through evaluate_block."""
+        # Cog creates its generators directly, so swap in our own class for
+        # the duration of the file. Type checkers take the attribute to be
+        # exactly CogGenerator, so it's set with setattr.
+        self._context = hashlib.sha256()
+        self._stateful = False
+        self._line_shift = 0
+        original = cogapp.cogapp.CogGenerator
+        setattr(cogapp.cogapp, "CogGenerator", _HookGenerator)  # noqa: B010
+        try:
+            super().process_file(file_in, file_out, fname, globals)
+        finally:
+            cogapp.cogapp.CogGenerator = original
+
+    def evaluate_block(
+        self, generator: CogGenerator, globals: dict[str, Any], fname: str
+    ) -> str:
+        """Run one generator block, returning its output."""
+        name = f"{self.cogmodule.inFile}:{self.cogmodule.firstLineNum}"
+        # Each block's context includes every earlier block in the file
+        self._context.update(json.dumps([generator.markers, generator.lines]).encode())
+        with timed(name) as timing:
+            if self._block_cache is not None:
+                output = self._evaluate_incrementally(generator, globals, fname)
+            else:
+                output = self._evaluate(generator, globals, fname)
+        self.block_timings.append(timing)
+        self._track_lines(generator, output)
+        return output
+
+    def _track_lines(self, generator: CogGenerator, output: str) -> None:
+        """Note where the current block's output will be, if it changed."""
+        previous = self.cogmodule.previous
+        # The block's code is on its begin marker line, or between its markers
+        end_spec = self.cogmodule.firstLineNum
+        if len(generator.markers) > 1:
+            end_spec += len(generator.lines) + 1
+        start = end_spec + 1 + self._line_shift
+        new_lines = len(output.splitlines())
+        if output != previous:
+            # The end marker's checksum changes along with the output
+            self.changed_blocks.append((start, start + new_lines))
+        self._line_shift += new_lines - len(previous.splitlines())
+
+    def _evaluate(
+        self, generator: CogGenerator, globals: dict[str, Any], fname: str
+    ) -> str:
+        if self.settings.dedupe:
+            return self._evaluate_deduplicated(generator, globals, fname)
+        return CogGenerator.evaluate(generator, self, globals, fname)
+
+    def _block_key(self) -> str:
+        """Compute the incremental cache key for the current block.
+
+        Blocks are identified by their file and the source of every block up to
+        and including them, but not their line number, which changes whenever
+        the output of an earlier block does.
+        """
+        hasher = hashlib.sha256()
+        hasher.update(f"{CACHE_VERSION}\0{cog_version}\0".encode())
+        for name, value in sorted(self.options.defines.items()):
+            hasher.update(
+                f"{name}={getattr(value, '__name__', type(value))}\0".encode()
+            )
+        hasher.update(os.path.abspath(self.cogmodule.inFile).encode() + b"\0")
+        hasher.update(self._context.digest())
+        return hasher.hexdigest()
+
+    def _evaluate_incrementally(
+        self, generator: CogGenerator, globals: dict[str, Any], fname: str
+    ) -> str:
+        """Run a generator unless its existing output is known to be current.
+
+        A block is skipped if its source and the blocks before it are unchanged,
+        its existing output is what it produced last time, and nothing it used
+        has changed since. The existing output is then kept as it is.
+
+        Skipping a block also skips any globals it would have assigned, so once
+        a block in a file has assigned globals, the rest of the file always
+        runs. Blocks that refer to the file they're in always run too.
+        """
+        assert self._block_cache is not None
+        key = self._block_key()
+        previous = self.cogmodule.previous
+        cacheable = not self._stateful and not FILE_SPECIFIC_RE.search(
+            "\n".join(generator.lines)
+        )
+
+        if cacheable and (stored := self._block_cache.get(key)) is not None:
+            try:
+                entry = json.loads(stored)
+                current = entry["output"] == _text_digest(previous) and is_current(
+                    entry["dependencies"]
+                )
+            except (ValueError, KeyError, TypeError):
+                current = False
+            if current:
+                self.unchanged_blocks += 1
+                self.skipped_blocks.append(self.cogmodule.firstLineNum)
+                record(Dependencies.from_snapshot(entry["dependencies"]))
+                return previous
+
+        before = {name: id(value) for name, value in globals.items()}
+        with recording() as dependencies:
+            output = self._evaluate(generator, globals, fname)
+        record(dependencies)
+        if _assigned_globals(before, globals) or not before.keys() <= globals.keys():
+            self._stateful = True
+        elif cacheable:
+            entry = {
+                "output": _text_digest(output),
+                "dependencies": snapshot(dependencies),
+            }
+            self._block_cache.put(key, json.dumps(entry).encode())
+        return output
+
+    def _evaluate_deduplicated(
+        self, generator: CogGenerator, globals: dict[str, Any], fname: str
+    ) -> str:
+        """Run a generator, reusing the output of an identical one if possible.
+
+        Blocks are identical if they have the same source, including markers,
+        and follow the same sequence of blocks in their file, so they start with
+        the same globals. Blocks that refer to the file they're in are always
+        run. A reused block's global assignments are replayed for later blocks,
+        so it's only shared between worker processes if it made none.
+        """
+        key = self._context.hexdigest()
+        if FILE_SPECIFIC_RE.search("\n".join(generator.lines)):
+            return CogGenerator.evaluate(generator, self, globals, fname)
+
+        stored = self._block_results.get(key)
+        if (
+            stored is None
+            and self._shared_results is not None
+            and (shared := self._shared_results.get(key)) is not None
+        ):
+            data = json.loads(shared)
+            stored = self._block_results[key] = _BlockResult(
+                output=data["output"], dependencies=data["dependencies"], globals={}
+            )
+        if stored is not None and (output := stored["output"]) is not None:
+            self.deduplicated += 1
+            globals.update(stored["globals"])
+            record(Dependencies.from_json(stored["dependencies"]))
+            return output
+
+        before = {name: id(value) for name, value in globals.items()}
+        with recording() as dependencies:
+            output = CogGenerator.evaluate(generator, self, globals, fname)
+        record(dependencies)
+        assigned = _assigned_globals(before, globals)
+        deleted = not before.keys() <= globals.keys()
+
+        stored = _BlockResult(
+            output=None if deleted else output,
+            dependencies=dependencies.to_json(),
+            globals=assigned,
+        )
+        self._block_results[key] = stored
+        if self._shared_results is not None and not assigned:
+            shared = {
+                "output": stored["output"],
+                "dependencies": stored["dependencies"],
+            }
+            self._shared_results.put(key, json.dumps(shared).encode())
+        return output
+
+    def stats(self) -> Counter[str]:
+        """Return the counters this instance has accumulated so far."""
+        stats: Counter[str] = Counter()
+        subprocess = self.options.defines["sp"]
+        if isinstance(subprocess, MemoizedSubprocess):
+            stats["subprocess cache hits"] = subprocess.hits
+            stats["subprocess cache misses"] = subprocess.misses
+        stats["deduplicated block executions"] = self.deduplicated
+        stats["unchanged blocks skipped"] = self.unchanged_blocks
+        return stats
+
+
+def _assigned_globals(
+    before: dict[str, int], globals: dict[str, Any]
+) -> dict[str, Any]:
+    """Return the globals a block assigned, given the ids of those before it ran."""
+    # Evaluating always binds the builtins and the cog module, and Python may
+    # add dunder names such as __warningregistry__ itself
+    return {
+        name: value
+        for name, value in globals.items()
+        if name != "cog"
+        and not (name.startswith("__") and name.endswith("__"))
+        and before.get(name) != id(value)
+    }
+
+
+def _text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def same_text(path_a: str, path_b: str, encoding: str) -> bool:
+    """Check whether two files hold the same text, reading a chunk at a time."""
+    with open(path_a, encoding=encoding) as a, open(path_b, encoding=encoding) as b:
+        while True:
+            chunk = a.read(COMPARE_CHUNK)
+            if chunk != b.read(COMPARE_CHUNK):
+                return False
+            if not chunk:
+                return True
+
+
+def replace_atomically(temp_path: str, path: str) -> None:
+    """Replace a file with a temporary file, keeping the original's permissions.
+
+    If the file is a symlink, the file it points to is replaced instead. The
+    temporary file must be on the same filesystem.
+
+    Raises:
+        CogError: If the original file can't be written
+    """
+    if not os.access(path, os.W_OK):
+        raise CogError(f"Can't overwrite {path}")
+    target = os.path.realpath(path)
+    shutil.copymode(target, temp_path)
+    os.replace(temp_path, target)
+
+
+def cache_key(file: str, defines: dict[str, object]) -> str:
+    """Compute the result cache key for a file.
+
+    The key covers the file's content (and so its generator source), its
+    location, the set of defines given to generators, and the versions of cog
+    and of this hook. It raises OSError if the file can't be read.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(f"{CACHE_VERSION}\0{cog_version}\0".encode())
+    for name, value in sorted(defines.items()):
+        hasher.update(f"{name}={getattr(value, '__name__', type(value))}\0".encode())
+    hasher.update(os.path.abspath(file).encode() + b"\0")
+    with open(file, "rb") as f:
+        hasher.update(hashlib.file_digest(f, "sha256").digest())
+    return hasher.hexdigest()
+
+
+def process_file(cog_instance: HookCog, file: str) -> FileResult:
+    """Run cog over one file, capturing anything it prints.
+
+    Output from cog itself and from the generators is buffered so that callers
+    can report it in a stable order, however the files were scheduled. The
+    files, directories and commands used by the generators are recorded too.
+    """
+    buffer = io.StringIO()
+    cog_instance.set_output(stdout=buffer)
+    result = FileResult(file=file)
+    stats_before = cog_instance.stats()
+    cog_instance.block_timings.clear()
+    cog_instance.changed_blocks.clear()
+    cog_instance.skipped_blocks.clear()
+    before = _stat_identity(file)
+    try:
+        with (
+            timed(file) as result.timing,
+            redirect_stdout(buffer),
+            recording() as dependencies,
+        ):
+            cog_instance.process_one_file(file)
+        # Cog reads the file itself, but that's covered by the cache key
+        dependencies.reads.discard(os.path.relpath(file).replace(os.sep, "/"))
+        result.dependencies = dependencies
+    except Exception as e:
+        result.error = f"Error processing {file}: {e}"
+    result.output = buffer.getvalue()
+    result.stats = cog_instance.stats() - stats_before
+    result.blocks = list(cog_instance.block_timings)
+    result.changed = _stat_identity(file) != before
+    if result.error is None and not result.changed:
+        result.stats["unchanged files not rewritten"] += 1
+    result.changed_blocks = list(cog_instance.changed_blocks)
+    result.skipped_blocks = list(cog_instance.skipped_blocks)
+    return result
+
+
+def _stat_identity(file: str) -> tuple[int, int, int] | None:
+    try:
+        stat = os.stat(file)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+# Each worker process gets its own Cog instance, created by _init_worker
+_worker_cog: HookCog | None = None
+
+
+def _init_worker(settings: CogSettings) -> None:
+    global _worker_cog
+    _worker_cog = HookCog(settings)
+
+
+def _process_in_worker(file: str) -> FileResult:
+    assert _worker_cog is not None, "worker was not initialised"
+    with repository_state():
+        return process_file(_worker_cog, file)
+
+
+def is_cached(cache: DiskCache, file: str, defines: dict[str, object]) -> bool:
+    """Check whether cog would leave a file unchanged, according to the cache.
+
+    A file is cached if cog has processed the same content before, and none of
+    the inputs its generators used have changed since.
+    """
+    try:
+        cached = cache.get(cache_key(file, defines))
+    except OSError:
+        # Let cog report the problem with the file
+        return False
+    if cached is None:
+        return False
+    try:
+        return is_current(json.loads(cached)["dependencies"])
+    except (ValueError, KeyError, TypeError):
+        return False
+
+
+def report_result(result: FileResult) -> bool:
+    """Print a file's buffered output and log its error, if any.
+
+    Returns True if the file was processed successfully.
+    """
+    if result.output:
+        print(result.output, end="")
+    if result.error is not None:
+        error_logger.error(result.error)
+        return False
+    return True
+
+
+def run_cog_on_files(
+    files: set[str],
+    jobs: int = 1,
+    cache: DiskCache | None = None,
+    settings: CogSettings | None = None,
+) -> bool:
     """Run cog on the specified files.
 
     Returns True if all files were processed successfully, False otherwise.
 
-    Note: Cog can only be run single-threaded, so files are processed sequentially.
+    Cog itself is single-threaded, so with more than one job each worker process
+    runs its own Cog instance. Results are always reported in filename order,
+    but files that took longest last time are started first.
+
+    If a cache is given, files whose content is known to be unchanged by cog
+    are skipped, and files cog processes successfully are recorded in it along
+    with the inputs their generators used, so that they're run again as soon as
+    one of those inputs changes.
     """
+    settings = settings or CogSettings()
+    files = prescan_cog_files(files)
     if not files:
         logger.info("No files with cog markers found.")
+        if settings.manifest is not None:
+            write_manifest(settings.manifest, [], [])
         return True
 
-    logger.info(f"Running cog on {len(files)} files...")
-    success = True
+    ordered = sorted(files)
+    defines = create_defines(settings)
 
-    # Create a Cog instance with the appropriate options
-    cog_instance = Cog()
-
-    # Set options equivalent to command-line flags
-    cog_instance.options.replace = True  # -r: replace in-place
-    cog_instance.options.hash_output = True  # -c: checksum
-    cog_instance.options.verbosity = 3
-
-    # Add imports to globals (equivalent to -p option)
-    cog_instance.options.defines = {
-        "subprocess": __import__("subprocess"),
-        "sp": __import__("subprocess"),
-        "re": __import__("re"),
-        "os": __import__("os"),
-        "sys": __import__("sys"),
-        "pathlib": __import__("pathlib"),
-        "pl": __import__("pathlib"),
-        "cog": __import__("cogapp.cogapp"),
-    }
+    cached: list[str] = []
+    if cache is not None:
+        with repository_state():
+            pending = [file for file in ordered if not is_cached(cache, file, defines)]
+        if len(pending) < len(ordered):
+            logger.info(f"Skipping {len(ordered) - len(pending)} unchanged files")
+        cached = sorted(set(ordered) - set(pending))
+        ordered = pending
+        if not ordered:
+            if settings.manifest is not None:
+                write_manifest(settings.manifest, [], cached)
+            return True
 
-    for file in files:
-        try:
-            # Process the content using process_string
-            cog_instance.process_one_file(file)
+    logger.info(f"Running cog on {len(ordered)} files...")
+    history = None
+    if jobs > 1 and len(ordered) > 1:
+        # Kept apart from the result cache, so that it's used without --cache
+        # and isn't evicted along with results
+        history = DurationHistory(DiskCache("durations", DURATIONS_MAX_BYTES))
+    success = True
+    stats: Counter[str] = Counter()
+    file_timings: list[Timing] = []
+    block_timings: list[Timing] = []
+    results: list[FileResult] = []
 
-        except Exception as e:
-            error_logger.error(f"Error processing {file}: {e}")
+    def handle(result: FileResult) -> None:
+        nonlocal success
+        results.append(result)
+        stats.update(result.stats)
+        if result.timing is not None:
+            file_timings.append(result.timing)
+        block_timings.extend(result.blocks)
+        if not report_result(result):
             success = False
+        elif cache is not None and result.dependencies is not None:
+            try:
+                key = cache_key(result.file, defines)
+            except OSError:
+                return
+            entry = {"file": result.file, "dependencies": snapshot(result.dependencies)}
+            cache.put(key, json.dumps(entry).encode())
+
+    with repository_state():
+        if jobs > 1 and len(ordered) > 1:
+            workers = min(jobs, len(ordered))
+            with tempfile.TemporaryDirectory(prefix="cog-shared-") as shared_dir:
+                # Let workers share repository facts and deduplicated blocks
+                settings = replace(settings, repo_facts_dir=f"{shared_dir}/repo")
+                if settings.dedupe:
+                    settings = replace(settings, dedupe_dir=f"{shared_dir}/dedupe")
+                schedule = ordered if history is None else history.schedule(ordered)
+                with ProcessPoolExecutor(
+                    max_workers=workers, initializer=_init_worker, initargs=(settings,)
+                ) as pool:
+                    # Start the slowest files first, so they don't finish last
+                    futures = {
+                        file: pool.submit(_process_in_worker, file) for file in schedule
+                    }
+                    # Results are still handled in filename order, keeping the log stable
+                    for file in ordered:
+                        handle(futures[file].result())
+        else:
+            cog_instance = HookCog(settings)
+            for file in ordered:
+                handle(process_file(cog_instance, file))
+
+    if history is not None:
+        history.update(file_timings)
+        history.cache.evict()
+    if cache is not None:
+        cache.evict()
+    if settings.memoize_subprocess and settings.subprocess_ttl > 0:
+        DiskCache("subprocess").evict(max_age=settings.subprocess_ttl)
+    if settings.incremental:
+        DiskCache("blocks").evict()
+    if settings.persist_repo_facts:
+        DiskCache("repo").evict()
+    if stats:
+        logger.info(
+            ", ".join(f"{count} {name}" for name, count in sorted(stats.items()))
+        )
+    report_timings(
+        file_timings,
+        block_timings,
+        slowest=settings.slowest,
+        report_path=settings.timing_report,
+        block_budget=settings.block_budget,
+    )
+    if settings.manifest is not None:
+        write_manifest(settings.manifest, results, cached)
 
     return success
 
 
-def main() -> None:
+def write_manifest(path: str, results: list[FileResult], cached: list[str]) -> None:
+    """Write a JSON manifest of what a run changed, for later tools to use.
+
+    Args:
+        path: Where to write the manifest
+        results: The results of every file cog processed, in filename order
+        cached: Files that were skipped because their result was cached
+    """
+    manifest = {
+        "changed": [
+            {
+                "file": result.file,
+                "blocks": [
+                    {"start": start, "end": end} for start, end in result.changed_blocks
+                ],
+            }
+            for result in results
+            if result.error is None and result.changed
+        ],
+        "unchanged": [
+            result.file
+            for result in results
+            if result.error is None and not result.changed
+        ],
+        "failed": [result.file for result in results if result.error is not None],
+        "cached": cached,
+        "skipped_blocks": [
+            {"file": result.file, "line": line}
+            for result in results
+            for line in result.skipped_blocks
+        ],
+        "timings": {
+            "files": [asdict(result.timing) for result in results if result.timing],
+            "blocks": [asdict(block) for result in results for block in result.blocks],
+        },
+    }
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+
+
+def positive_int(value: str) -> int:
+    """Parse an argument that must be a whole number greater than zero."""
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got {value!r}")
+    return number
+
+
+def define_module(value: str) -> tuple[str, str]:
+    """Parse a `--define-module` argument into a global name and a module."""
+    name, _, module = value.partition("=")
+    module = module or name
+    if not name.isidentifier() or not all(
+        part.isidentifier() for part in module.split(".")
+    ):
+        raise argparse.ArgumentTypeError(f"expected NAME=MODULE, got {value!r}")
+    return name, module
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    """Parse the hook's command-line arguments."""
+    parser = argparse.ArgumentParser(
+        prog="pre-commit-cog",
+        description="Find files with cog markers and run cog on them.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes to use; 0 means one per CPU (default: 1)",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Check the checksum of every generated block without running any "
+        "generators, printing each failure as a line of JSON",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Skip files that cog is known to leave unchanged, using a result "
+        "cache. Not every input generators use is tracked, so this is opt-in",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Run cog on every file, ignoring and not updating the result cache "
+        "(the default; overrides --cache)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="Maximum size of the result cache in MiB (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--memoize-subprocess",
+        action="store_true",
+        help="Run each distinct command that generators capture the output of "
+        "only once per run",
+    )
+    parser.add_argument(
+        "--subprocess-ttl",
+        type=float,
+        default=0,
+        help="With --memoize-subprocess, also reuse command output from previous "
+        "runs for this many seconds (default: 0)",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="Run identical generator blocks once, reusing their output in every "
+        "file that contains them",
+    )
+    parser.add_argument(
+        "--slowest",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Report the N slowest files and generator blocks",
+    )
+    parser.add_argument(
+        "--timing-report",
+        metavar="PATH",
+        help="Write the time taken by every file and generator block to PATH as JSON",
+    )
+    parser.add_argument(
+        "--block-budget",
+        type=float,
+        metavar="SECONDS",
+        help="Warn about generator blocks that take longer than SECONDS",
+    )
+    parser.add_argument(
+        "--manifest",
+        metavar="PATH",
+        help="Write a JSON manifest of the files and blocks cog changed, the files "
+        "and blocks it skipped, and how long each took, to PATH",
+    )
+    parser.add_argument(
+        "--recursive",
+        action="store_true",
+        help="Also process the files listed by `.cogfiles` in subdirectories, "
+        "relative to each `.cogfiles`",
+    )
+    parser.add_argument(
+        "--changed-only",
+        action="store_true",
+        help="Only process files that are in FILENAMES, or that declare a dependency "
+        "on one of them with `cog-depends:`",
+    )
+    parser.add_argument(
+        "--persist-repo-facts",
+        action="store_true",
+        help="Reuse the facts in `repo` from earlier runs while everything they "
+        "were computed from is unchanged",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only rerun generator blocks whose source, existing output or inputs "
+        "changed since they last ran, keeping the output of the others",
+    )
+    parser.add_argument(
+        "--stream-threshold",
+        type=float,
+        default=DEFAULT_STREAM_THRESHOLD / (1024 * 1024),
+        metavar="MIB",
+        help="Stream files of at least this size through cog rather than reading "
+        "them into memory, so only one generated block at a time is held in memory "
+        "(default: %(default)g)",
+    )
+    parser.add_argument(
+        "--define-module",
+        action="append",
+        type=define_module,
+        default=[],
+        metavar="NAME=MODULE",
+        help="Make MODULE available to generators as NAME, importing it only if a "
+        "generator uses it. A bare MODULE uses its own name. May be repeated",
+    )
+    parser.add_argument(
+        "--parallel-limit",
+        type=positive_int,
+        metavar="N",
+        help="Run at most N commands at once from cog_parallel (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--parallel-timeout",
+        type=float,
+        metavar="SECONDS",
+        help="Fail any command run by cog_parallel that takes longer than SECONDS",
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Run cog in this process, even if a cog daemon is running",
+    )
+    parser.add_argument(
+        "filenames",
+        nargs="*",
+        help="Changed files, as passed by pre-commit with pass_filenames: true",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
     """Find files with cog markers and run cog on them."""
-    files = find_cog_files()
-    success = run_cog_on_files(files)
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
+
+    cache = None
+    if args.cache and not args.no_cache:
+        cache = DiskCache("cog", max_bytes=args.cache_size * 1024 * 1024)
+
+    settings = CogSettings(
+        memoize_subprocess=args.memoize_subprocess,
+        subprocess_ttl=args.subprocess_ttl,
+        dedupe=args.dedupe,
+        slowest=args.slowest,
+        timing_report=args.timing_report,
+        block_budget=args.block_budget,
+        define_modules=dict(args.define_module),
+        parallel_limit=args.parallel_limit,
+        parallel_timeout=args.parallel_timeout,
+        persist_repo_facts=args.persist_repo_facts,
+        manifest=args.manifest,
+        incremental=args.incremental,
+        stream_threshold=int(args.stream_threshold * 1024 * 1024),
+    )
+
+    files = find_cog_files(cache, recursive=args.recursive)
+    if args.changed_only:
+        files = select_changed_files(files, args.filenames)
+    if args.verify:
+        success = verify_files(prescan_cog_files(files), jobs=jobs)
+    else:
+        success = run_cog_on_files(files, jobs=jobs, cache=cache, settings=settings)
 
     if not success:
         sys.exit(1)
@@ -0,0 +1,328 @@
+"""A long-lived cog server, and the thin client that `pre-commit-cog` runs.
+
+The client only imports the standard library, so that it starts quickly. If no
+daemon is listening, it falls back to running cog in-process.
+"""
+
+import argparse
+import importlib
+import io
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from importlib import metadata
+from typing import Any
+
+from andrewaylett_pre_commit_hooks import error_handler, error_logger, handler, logger
+
+# Set to any non-empty value to stop the client from using a daemon
+NO_DAEMON_ENV = "PRE_COMMIT_COG_NO_DAEMON"
+# Overrides the path of the daemon's socket
+SOCKET_ENV = "PRE_COMMIT_COG_SOCKET"
+
+# The distribution whose version the client and daemon must agree on
+DISTRIBUTION = "andrewaylett-pre-commit-hooks"
+
+# Seconds to wait for a daemon to accept a connection
+CONNECT_TIMEOUT = 1.0
+# Seconds to wait for a daemon to finish a run
+REQUEST_TIMEOUT = 300.0
+
+
+def socket_path() -> str:
+    """Return the path of the daemon's Unix socket.
+
+    The socket lives in a directory only the current user can access,
+    `$XDG_RUNTIME_DIR/andrewaylett-pre-commit-hooks` if `$XDG_RUNTIME_DIR` is
+    set, or a directory named after the user ID in the system temporary
+    directory otherwise.
+    """
+    if path := os.environ.get(SOCKET_ENV):
+        return path
+    if runtime_dir := os.environ.get("XDG_RUNTIME_DIR"):
+        directory = os.path.join(runtime_dir, "andrewaylett-pre-commit-hooks")
+    else:
+        directory = os.path.join(
+            tempfile.gettempdir(), f"andrewaylett-pre-commit-hooks-{os.getuid()}"
+        )
+    return os.path.join(directory, "cog.sock")
+
+
+def _is_private_directory(path: str) -> bool:
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    return (
+        stat.S_ISDIR(info.st_mode)
+        and info.st_uid == os.getuid()
+        and stat.S_IMODE(info.st_mode) & 0o077 == 0
+    )
+
+
+def is_private(path: str) -> bool:
+    """Check that a socket can only have been created by the current user.
+
+    Both the socket and the directory containing it must belong to the current
+    user, and nobody else may have any access to the directory.
+    """
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    return (
+        stat.S_ISSOCK(info.st_mode)
+        and info.st_uid == os.getuid()
+        and _is_private_directory(os.path.dirname(os.path.abspath(path)))
+    )
+
+
+def identity() -> dict[str, str | None]:
+    """Return what a client and the daemon serving it must have in common.
+
+    A daemon started before the hooks were upgraded, or from a different
+    environment, would otherwise keep running old code for new clients.
+    """
+    try:
+        version = metadata.version(DISTRIBUTION)
+    except metadata.PackageNotFoundError:
+        version = None
+    return {"version": version, "executable": sys.executable}
+
+
+def check_identity(message: dict[str, Any], expected: dict[str, Any]) -> str | None:
+    """Return why a daemon can't serve a request, or None if it can."""
+    for name, value in expected.items():
+        if message.get(name) != value:
+            return f"its {name} is {value}, not {message.get(name)}"
+    return None
+
+
+def _receive(sock: socket.socket) -> Any:
+    chunks = []
+    while chunk := sock.recv(65536):
+        chunks.append(chunk)
+    return json.loads(b"".join(chunks))
+
+
+def request(argv: list[str], path: str | None = None) -> int | None:
+    """Ask a running daemon to run cog with the given arguments.
+
+    The daemon runs in this process's working directory and environment, and
+    its output is written to this process's stdout and stderr.
+
+    Args:
+        argv: Arguments for `pre-commit-cog`
+        path: The daemon's socket, if not the default
+
+    The daemon is only used if its socket is private to the current user, so
+    the whole environment can be passed on.
+    It refuses requests from clients with a different `identity`.
+
+    Returns:
+        The exit status, or None if no daemon is available. A daemon that
+        doesn't finish in time counts as a failure.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    path = path or socket_path()
+    if not os.path.exists(path):
+        return None
+    if not is_private(path):
+        logger.warning(f"Not using the cog daemon at {path}, as it isn't private")
+        return None
+    message = {"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ), **identity()}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(path)
+        except OSError:
+            return None
+        try:
+            sock.settimeout(REQUEST_TIMEOUT)
+            sock.sendall(json.dumps(message).encode())
+            sock.shutdown(socket.SHUT_WR)
+            response = _receive(sock)
+        except TimeoutError:
+            # The daemon may still be writing files, so running cog here would race it
+            error_logger.error(
+                f"The cog daemon didn't finish within {REQUEST_TIMEOUT:g} seconds"
+            )
+            return 1
+        except (OSError, ValueError):
+            return None
+
+    if "refused" in response:
+        logger.warning(
+            f"Not using the cog daemon, as {response['refused']}: restart it"
+        )
+        return None
+
+    sys.stdout.write(response["stdout"])
+    sys.stdout.flush()
+    sys.stderr.write(response["stderr"])
+    sys.stderr.flush()
+    return response["status"]
+
+
+def client_main() -> None:
+    """Run cog through a daemon if one is running, or in-process otherwise."""
+    argv = sys.argv[1:]
+    if "--no-daemon" not in argv and not os.environ.get(NO_DAEMON_ENV):
+        status = request(argv)
+        if status is not None:
+            if status != 0:
+                sys.exit(status)
+            return
+
+    from andrewaylett_pre_commit_hooks.cog import main
+
+    main(argv)
+
+
+def run_request(message: dict[str, Any]) -> dict[str, Any]:
+    """Run cog for a client, in its working directory and environment.
+
+    Requests are handled one at a time, as they change process-wide state.
+    Modules imported by generators are forgotten afterwards, so that changes
+    to them are seen by the next request.
+    """
+    from andrewaylett_pre_commit_hooks.cog import main
+
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    original_cwd = os.getcwd()
+    original_env = dict(os.environ)
+    original_streams = (handler.stream, error_handler.stream)
+    original_modules = set(sys.modules)
+    original_path = list(sys.path)
+    importlib.invalidate_caches()
+    status = 0
+    try:
+        os.chdir(message["cwd"])
+        os.environ.clear()
+        os.environ.update(message["env"])
+        handler.setStream(stdout)
+        error_handler.setStream(stderr)
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                main([*message["argv"], "--no-daemon"])
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else 1
+            except Exception:
+                traceback.print_exc()
+                status = 2
+    finally:
+        for name in set(sys.modules) - original_modules:
+            del sys.modules[name]
+        sys.path[:] = original_path
+        handler.setStream(original_streams[0])
+        error_handler.setStream(original_streams[1])
+        os.environ.clear()
+        os.environ.update(original_env)
+        os.chdir(original_cwd)
+    return {"status": status, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        try:
+            message = _receive(self.request)
+        except (OSError, ValueError) as e:
+            logger.info(f"Ignoring malformed request: {e}")
+            return
+        assert isinstance(self.server, _Server)
+        if (reason := check_identity(message, self.server.identity)) is not None:
+            response: dict[str, Any] = {"refused": reason}
+        else:
+            response = run_request(message)
+        self.request.sendall(json.dumps(response).encode())
+
+
+class _Server(socketserver.UnixStreamServer):
+    def __init__(self, path: str):
+        super().__init__(path, _RequestHandler)
+        # What the daemon was started as, which every client must match
+        self.identity = identity()
+
+
+def make_server(path: str | None = None) -> socketserver.UnixStreamServer:
+    """Create a cog daemon listening on a Unix socket.
+
+    Raises:
+        RuntimeError: If another daemon is already listening on the socket, or
+            its directory isn't private to the current user
+    """
+    # Pay for the imports once, up front, rather than on the first request
+    from andrewaylett_pre_commit_hooks import cache, cog
+
+    cache.keep_in_memory()
+    cog.HookCog()
+
+    path = path or socket_path()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not _is_private_directory(directory):
+        raise RuntimeError(
+            f"{directory} must belong to you, and nobody else may have access to it"
+        )
+    if os.path.exists(path):
+        if request_is_answered(path):
+            raise RuntimeError(f"A cog daemon is already listening on {path}")
+        # Left behind by a daemon that didn't exit cleanly
+        os.unlink(path)
+    return _Server(path)
+
+
+def serve(path: str | None = None) -> None:
+    """Serve cog requests on a Unix socket until interrupted."""
+    path = path or socket_path()
+    with make_server(path) as server:
+        logger.info(f"Cog daemon listening on {path}")
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(path)
+
+
+def request_is_answered(path: str) -> bool:
+    """Check whether something is listening on a Unix socket."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+def main() -> None:
+    """Run a cog daemon for `pre-commit-cog` to use."""
+    parser = argparse.ArgumentParser(
+        prog="pre-commit-cog-daemon",
+        description="Keep cog warm, so pre-commit-cog starts quickly.",
+    )
+    parser.add_argument(
+        "--socket",
+        default=None,
+        help=f"Path of the Unix socket to listen on (default: {socket_path()})",
+    )
+    args = parser.parse_args()
+
+    try:
+        serve(args.socket)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logger.error(f"Error running cog daemon: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+import hashlib
+import os
+import sys
+from collections.abc import Callable, Generator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from types import ModuleType
+from typing import Any
+
+from andrewaylett_pre_commit_hooks.file_index import refs_state, tree_state
+
+# os.open flags that mean a file is being written rather than read
+WRITE_FLAGS = os.O_WRONLY | os.O_RDWR | os.O_CREAT | os.O_TRUNC | os.O_APPEND
+
+# Directories whose contents are never treated as generator inputs
+IGNORED_DIRS = frozenset({".git", "__pycache__"})
+
+# Modules installed here are part of an environment, not the project
+INSTALL_PREFIXES = tuple(
+    os.path.join(os.path.abspath(prefix), "")
+    for prefix in {sys.prefix, sys.base_prefix, sys.exec_prefix}
+)
+
+
+@dataclass
+class Dependencies:
+    """The inputs used by a file's generators while cog ran them.
+
+    Paths are relative to the directory cog was run from. Anything outside
+    that directory is not recorded.
+    """
+
+    reads: set[str] = field(default_factory=set)
+    listings: set[str] = field(default_factory=set)
+    commands: list[list[str]] = field(default_factory=list)
+
+    def to_json(self) -> dict[str, Any]:
+        """Return the dependencies as JSON-compatible data."""
+        return {
+            "reads": sorted(self.reads),
+            "listings": sorted(self.listings),
+            "commands": self.commands,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> "Dependencies":
+        """Create dependencies from data returned by `to_json`."""
+        return cls(set(data["reads"]), set(data["listings"]), data["commands"])
+
+    @classmethod
+    def from_snapshot(cls, recorded: dict[str, Any]) -> "Dependencies":
+        """Create dependencies from data returned by `snapshot`."""
+        return cls(
+            set(recorded["reads"]), set(recorded["listings"]), recorded["commands"]
+        )
+
+
+class _Recorder:
+    def __init__(self, root: str):
+        self.root = root
+        self.dependencies = Dependencies()
+
+    def relative(self, path: Any) -> str | None:
+        if path is None:
+            path = "."
+        elif isinstance(path, int):
+            return None
+        try:
+            path = os.path.abspath(os.fsdecode(os.fspath(path)))
+        except TypeError:
+            return None
+        relative = os.path.relpath(path, self.root)
+        if relative.startswith(os.pardir):
+            return None
+        if not IGNORED_DIRS.isdisjoint(relative.split(os.sep)):
+            return None
+        return relative.replace(os.sep, "/")
+
+
+# The source file of each module in sys.modules, and the module it was found
+# for, so that modules imported earlier aren't inspected again
+_module_sources: dict[str, tuple[ModuleType | None, str | None]] = {}
+
+
+def _module_source(module: ModuleType | None) -> str | None:
+    spec = getattr(module, "__spec__", None)
+    if spec is not None and spec.has_location:
+        path = spec.origin
+    else:
+        path = getattr(module, "__file__", None)
+    if not isinstance(path, str):
+        return None
+    path = os.path.abspath(path)
+    return None if path.startswith(INSTALL_PREFIXES) else path
+
+
+def imported_sources() -> list[str]:
+    """Return the source files of every module imported so far.
+
+    Modules installed in Python's environment, and modules without a source
+    file, aren't included.
+    """
+    global _module_sources
+    sources = {}
+    for name, module in list(sys.modules.items()):
+        known = _module_sources.get(name)
+        if known is None or known[0] is not module:
+            known = (module, _module_source(module))
+        sources[name] = known
+    _module_sources = sources
+    return [path for _, path in sources.values() if path is not None]
+
+
+def _record_modules(recorder: _Recorder) -> None:
+    # A module imported earlier comes from sys.modules without being read, and
+    # one with fresh bytecode only has its cached bytecode read, so generators
+    # are taken to depend on the source of every module they could reach.
+    prefix = os.path.join(recorder.root, "")
+    for path in imported_sources():
+        if path.startswith(prefix) and (relative := recorder.relative(path)):
+            recorder.dependencies.reads.add(relative)
+
+
+# The recorder for the file being processed, if any.
+# A plain global rather than a context variable, so that commands run from
+# threads started by a generator are recorded too.
+_active: _Recorder | None = None
+_hook_installed = False
+
+
+def _audit_hook(event: str, args: tuple) -> None:
+    recorder = _active
+    if recorder is None:
+        return
+    if event == "open":
+        path, mode, flags = args
+        if isinstance(mode, str):
+            if not set(mode).isdisjoint("wxa+"):
+                return
+        elif isinstance(flags, int) and flags & WRITE_FLAGS:
+            return
+        if (relative := recorder.relative(path)) is not None:
+            recorder.dependencies.reads.add(relative)
+    elif event in ("os.listdir", "os.scandir"):
+        if (relative := recorder.relative(args[0])) is not None:
+            recorder.dependencies.listings.add(relative)
+    elif event == "subprocess.Popen":
+        _, command, cwd, _ = args
+        record_command(command, cwd)
+    elif event == "os.system":
+        record_command(args[0])
+
+
+def record_command(command: Any, cwd: Any = None) -> None:
+    """Record that a command was used, if dependencies are being recorded.
+
+    Commands run through `subprocess` are recorded automatically. This is for
+    code that provides a command's output without running it.
+    """
+    recorder = _active
+    if recorder is None:
+        return
+    if isinstance(command, (str, bytes, os.PathLike)):
+        command = [command]
+    argv = [os.fsdecode(arg) for arg in command]
+    recorder.dependencies.commands.append([os.fsdecode(cwd or "."), *argv])
+
+
+def record(dependencies: Dependencies) -> None:
+    """Add previously recorded dependencies to those being recorded, if any.
+
+    This is for code that reuses the result of work done while recording.
+    """
+    recorder = _active
+    if recorder is None:
+        return
+    recorder.dependencies.reads.update(dependencies.reads)
+    recorder.dependencies.listings.update(dependencies.listings)
+    recorder.dependencies.commands.extend(dependencies.commands)
+
+
+@contextmanager
+def recording(root: str = ".") -> Generator[Dependencies, None, None]:
+    """Record the files, directories and commands used within the block.
+
+    Uses an audit hook, so reads through `open`, `pathlib` and any other
+    Python code are seen, as are commands run through `subprocess`. The source
+    files of imported modules below root are recorded too, whether or not they
+    were imported within the block.
+
+    Args:
+        root: Only inputs below this directory are recorded
+
+    Yields:
+        The dependencies, which are filled in as the block runs
+    """
+    global _active, _hook_installed
+    if not _hook_installed:
+        # Audit hooks can't be removed, so install ours once per process
+        sys.addaudithook(_audit_hook)
+        _hook_installed = True
+    recorder = _Recorder(os.path.abspath(root))
+    previous, _active = _active, recorder
+    try:
+        yield recorder.dependencies
+    finally:
+        _active = previous
+        _record_modules(recorder)
+
+
+@contextmanager
+def paused() -> Generator[None, None, None]:
+    """Stop recording within the block, for work that isn't a generator's."""
+    global _active
+    previous, _active = _active, None
+    try:
+        yield
+    finally:
+        _active = previous
+
+
+_repository_states: dict[str, str | None] | None = None
+
+
+@contextmanager
+def repository_state() -> Generator[None, None, None]:
+    """Ask git for the state of the repository at most once within the block.
+
+    Every snapshot and check of a file whose generators ran commands needs the
+    state of the git index and refs. Within the block, they're computed the
+    first time they're needed and reused after that. A change the block's own
+    generators make to the repository is therefore only noticed by later runs.
+    """
+    global _repository_states
+    previous = _repository_states
+    if previous is None:
+        _repository_states = {}
+    try:
+        yield
+    finally:
+        _repository_states = previous
+
+
+def _repository_token(name: str, compute: Callable[[], str | None]) -> str | None:
+    if _repository_states is None:
+        return compute()
+    if name not in _repository_states:
+        _repository_states[name] = compute()
+    return _repository_states[name]
+
+
+def _file_fingerprint(path: str) -> list | None:
+    try:
+        stat = os.stat(path)
+        with open(path, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns, digest]
+
+
+def _listing_digest(path: str) -> str | None:
+    try:
+        names = sorted(os.listdir(path))
+    except OSError:
+        return None
+    return hashlib.sha256("\0".join(names).encode()).hexdigest()
+
+
+def snapshot(dependencies: Dependencies) -> dict[str, Any]:
+    """Capture the current state of a set of dependencies as JSON-compatible data.
+
+    Files are fingerprinted by content, and directories by the names they
+    contain. Cog can't know what a command's output depends on, so commands are
+    assumed to depend on the whole repository, and are captured as the state of
+    the git index, `HEAD` and every ref.
+
+    Some inputs are not captured: checks like `os.path.exists` and `os.stat`,
+    which raise no audit events, files outside the root, and environment
+    variables.
+    """
+    return {
+        "reads": {path: _file_fingerprint(path) for path in sorted(dependencies.reads)},
+        "listings": {
+            path: _listing_digest(path) for path in sorted(dependencies.listings)
+        },
+        "commands": dependencies.commands,
+        "tree": _repository_token("tree", tree_state)
+        if dependencies.commands
+        else None,
+        "refs": _repository_token("refs", refs_state)
+        if dependencies.commands
+        else None,
+    }
+
+
+def is_current(recorded: dict[str, Any]) -> bool:
+    """Check whether every dependency in a snapshot is unchanged.
+
+    A file whose size and modification time are unchanged is assumed to be
+    unchanged, otherwise its content is compared.
+    """
+    for path, fingerprint in recorded["reads"].items():
+        if fingerprint is None:
+            if os.path.exists(path):
+                return False
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if [stat.st_size, stat.st_mtime_ns] == fingerprint[:2]:
+            continue
+        current = _file_fingerprint(path)
+        if current is None or current[2] != fingerprint[2]:
+            return False
+    for path, digest in recorded["listings"].items():
+        if _listing_digest(path) != digest:
+            return False
+    if recorded["commands"]:
+        current_tree = _repository_token("tree", tree_state)
+        if current_tree is None or current_tree != recorded["tree"]:
+            return False
+        current_refs = _repository_token("refs", refs_state)
+        if current_refs is None or current_refs != recorded.get("refs"):
+            return False
+    return True
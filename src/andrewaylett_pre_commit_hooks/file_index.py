@@ -0,0 +1,209 @@
+import hashlib
+import os
+import re
+import subprocess
+from collections.abc import Iterable
+
+from andrewaylett_pre_commit_hooks import logger
+
+# Characters that make a line in a file list a glob rather than a literal path
+GLOB_CHARS = frozenset("*?[")
+
+
+def is_pattern(entry: str, root: str | None = None) -> bool:
+    """Check whether a file list entry is a pattern rather than a literal path.
+
+    Args:
+        entry: The entry to check
+        root: If given, an entry that names a path existing below root is a
+            literal path, even if it contains glob characters
+
+    Returns:
+        True if the entry is a pattern
+    """
+    if entry.startswith("!") or entry.endswith("/"):
+        return True
+    if GLOB_CHARS.isdisjoint(entry):
+        return False
+    return root is None or not os.path.exists(os.path.join(root, entry))
+
+
+def compile_pattern(pattern: str) -> re.Pattern[str]:
+    """Compile a gitignore-style glob into a regular expression.
+
+    - `*` and `?` match within a single path segment
+    - `**/` matches zero or more directories, and a trailing `**` matches
+      everything below a directory
+    - `[...]` matches a character class, `[!...]` its complement
+    - A trailing `/` matches everything below the named directory
+    - A leading `/` is ignored: patterns are always relative to the list
+
+    Args:
+        pattern: The glob to compile
+
+    Returns:
+        A regular expression that matches the whole of a relative path
+    """
+    pattern = pattern.lstrip("/")
+    if pattern.endswith("/"):
+        pattern += "**"
+
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and (end := pattern.find("]", i + 2)) != -1:
+            body = pattern[i + 1 : end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            parts.append("[" + body.replace("\\", "\\\\") + "]")
+            i = end + 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile("".join(parts) + r"\Z")
+
+
+def resolve_entries(
+    entries: Iterable[str], files: Iterable[str], root: str | None = None
+) -> set[str]:
+    """Resolve a list of literal paths and patterns against a file listing.
+
+    Entries are applied in order: literal paths are always included, patterns
+    include every matching file in the listing, and `!`-prefixed patterns
+    remove matching files included by earlier entries.
+
+    Args:
+        entries: Literal paths and patterns, relative to the listing
+        files: Paths of every file in the listing
+        root: The directory the entries are relative to, if existing paths
+            should be taken literally (see `is_pattern`)
+
+    Returns:
+        The set of selected paths
+    """
+    files = list(files)
+    selected: set[str] = set()
+    for entry in entries:
+        if entry.startswith("!"):
+            regex = compile_pattern(entry[1:])
+            selected = {path for path in selected if not regex.match(path)}
+        elif is_pattern(entry, root):
+            regex = compile_pattern(entry)
+            selected.update(path for path in files if regex.match(path))
+        else:
+            selected.add(entry)
+    return selected
+
+
+def _walk_files(root: str) -> list[str]:
+    """List every file below root with a single scandir walk, skipping .git."""
+    found = []
+    stack = [""]
+    while stack:
+        prefix = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(root, prefix) if prefix else root)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                path = prefix + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name != ".git":
+                        stack.append(path + "/")
+                elif entry.is_file():
+                    found.append(path)
+    return found
+
+
+def list_repository_files(root: str = ".") -> list[str]:
+    """List the files in a repository with a single call.
+
+    Uses the files tracked by git if root is inside a git repository, or else a
+    single walk of the directory tree.
+
+    Args:
+        root: The directory to list, which paths are relative to
+
+    Returns:
+        Relative paths of every file, using `/` as the separator
+    """
+    try:
+        result = subprocess.run(
+            ["git", "ls-files", "-z"],
+            cwd=root,
+            check=True,
+            capture_output=True,
+        )
+        return [path for path in os.fsdecode(result.stdout).split("\0") if path]
+    except (OSError, subprocess.CalledProcessError):
+        logger.debug("Not a git repository, walking the directory tree instead")
+        return _walk_files(root)
+
+
+def tree_state(root: str = ".") -> str | None:
+    """Return a token that changes whenever git's list of tracked files may have.
+
+    The token is derived from the git index file's metadata, so it is cheap to
+    compute however large the repository is.
+
+    Args:
+        root: A directory inside the repository
+
+    Returns:
+        The token, or None if root is not inside a git repository
+    """
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--path-format=absolute", "--git-path", "index"],
+            cwd=root,
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        index = result.stdout.strip()
+        stat = os.stat(index)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    token = f"{os.path.abspath(root)}\0{index}\0{stat.st_mtime_ns}\0{stat.st_size}"
+    token += f"\0{stat.st_ino}"
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def refs_state(root: str = ".") -> str | None:
+    """Return a token that changes whenever `HEAD` or any ref moves.
+
+    This covers new commits, branches and tags, none of which need change the
+    git index.
+
+    Args:
+        root: A directory inside the repository
+
+    Returns:
+        The token, or None if root is not inside a git repository
+    """
+    try:
+        result = subprocess.run(
+            ["git", "show-ref", "--head"],
+            cwd=root,
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return None
+    # show-ref exits with 1 when there are no refs yet
+    if result.returncode not in (0, 1):
+        return None
+    return hashlib.sha256(result.stdout.encode()).hexdigest()
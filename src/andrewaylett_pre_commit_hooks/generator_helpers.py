@@ -0,0 +1,391 @@
+import base64
+import glob
+import hashlib
+import importlib
+import json
+import os
+import subprocess
+import threading
+import time
+import tomllib
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from typing import Any
+
+from andrewaylett_pre_commit_hooks.cache import DiskCache
+from andrewaylett_pre_commit_hooks.dependencies import (
+    Dependencies,
+    is_current,
+    paused,
+    record,
+    record_command,
+    recording,
+    snapshot,
+)
+from andrewaylett_pre_commit_hooks.file_index import list_repository_files
+
+# Bump this whenever a change could change the value of a repository fact
+FACTS_VERSION = "1"
+
+# Environment variables that are part of a memoized command's identity when the
+# caller doesn't pass an explicit environment
+RELEVANT_ENV = ("PATH", "VIRTUAL_ENV")
+
+
+def _encode(value: str | bytes | None) -> Any:
+    if isinstance(value, bytes):
+        return {"b64": base64.b64encode(value).decode("ascii")}
+    return value
+
+
+def _decode(value: Any) -> str | bytes | None:
+    if isinstance(value, dict):
+        return base64.b64decode(value["b64"])
+    return value
+
+
+class LazyModule:
+    """A stand-in for a module that only imports it when it's first used.
+
+    Reading or setting any attribute other than `__name__` imports the module,
+    and is then passed straight through to it.
+    """
+
+    __slots__ = ("__name__", "_module")
+
+    def __init__(self, name: str):
+        object.__setattr__(self, "__name__", name)
+        object.__setattr__(self, "_module", None)
+
+    def _load(self) -> Any:
+        module = object.__getattribute__(self, "_module")
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            object.__setattr__(self, "_module", module)
+        return module
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._load(), name, value)
+
+    def __delattr__(self, name: str) -> None:
+        delattr(self._load(), name)
+
+    def __dir__(self) -> list[str]:
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        module = object.__getattribute__(self, "_module")
+        if module is None:
+            return f"<lazy module {self.__name__!r}>"
+        return repr(module)
+
+
+class MemoizedSubprocess:
+    """A stand-in for the `subprocess` module that memoizes captured output.
+
+    Calls to `run` and `check_output` that capture the command's output are
+    looked up by their arguments, working directory and environment, so each
+    distinct command only runs once. Anything else is passed straight through
+    to `subprocess`.
+
+    If a cache is given, results are also shared between runs of the hook for
+    up to `ttl` seconds.
+    """
+
+    def __init__(self, cache: DiskCache | None = None, ttl: float = 0):
+        self.cache = cache
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._results: dict[str, subprocess.CompletedProcess] = {}
+        # Commands may be run from several threads by ParallelRunner
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(subprocess, name)
+
+    def _key(self, args: Any, kwargs: dict[str, Any]) -> str | None:
+        """Return the memo key for a call, or None if it can't be memoized."""
+        if kwargs.get("capture_output"):
+            kwargs = {**kwargs, "stdout": subprocess.PIPE, "stderr": subprocess.PIPE}
+            del kwargs["capture_output"]
+        if kwargs.get("stdout") != subprocess.PIPE:
+            return None
+        if kwargs.get("stdin") not in (None, subprocess.DEVNULL):
+            return None
+
+        if isinstance(args, (str, bytes, os.PathLike)):
+            argv = [os.fsdecode(args)]
+        else:
+            argv = [os.fsdecode(arg) for arg in args]
+        env = kwargs.pop("env", None)
+        if env is None:
+            env = {name: os.environ.get(name) for name in RELEVANT_ENV}
+        cwd = os.path.abspath(os.fsdecode(kwargs.pop("cwd", None) or "."))
+        options = {
+            name: _encode(value) if name == "input" else value
+            for name, value in kwargs.items()
+            if name not in ("check", "timeout")
+        }
+        try:
+            identity = json.dumps(
+                [argv, cwd, sorted(env.items()), options], sort_keys=True
+            )
+        except TypeError:
+            # Options such as file objects can't be part of a key
+            return None
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    def _load(self, key: str) -> subprocess.CompletedProcess | None:
+        if key in self._results:
+            return self._results[key]
+        if self.cache is None or (stored := self.cache.get(key)) is None:
+            return None
+        try:
+            entry = json.loads(stored)
+            if time.time() - entry["time"] > self.ttl:
+                return None
+            result = subprocess.CompletedProcess(
+                entry["args"],
+                entry["returncode"],
+                _decode(entry["stdout"]),
+                _decode(entry["stderr"]),
+            )
+        except (ValueError, KeyError, TypeError):
+            return None
+        self._results[key] = result
+        return result
+
+    def _store(self, key: str, result: subprocess.CompletedProcess) -> None:
+        self._results[key] = result
+        if self.cache is None:
+            return
+        entry = {
+            "time": time.time(),
+            "args": result.args
+            if isinstance(result.args, str)
+            else [os.fsdecode(arg) for arg in result.args],
+            "returncode": result.returncode,
+            "stdout": _encode(result.stdout),
+            "stderr": _encode(result.stderr),
+        }
+        self.cache.put(key, json.dumps(entry).encode())
+
+    def run(self, args: Any, **kwargs: Any) -> subprocess.CompletedProcess:
+        """Run a command like `subprocess.run`, reusing captured results."""
+        key = self._key(args, dict(kwargs))
+        if key is None:
+            return subprocess.run(args, **kwargs)
+
+        with self._lock:
+            result = self._load(key)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if result is None:
+            check = kwargs.pop("check", False)
+            result = subprocess.run(args, **kwargs)
+            self._store(key, result)
+            if check:
+                result.check_returncode()
+        else:
+            # The command didn't run, but the generator still depends on it
+            record_command(args, kwargs.get("cwd"))
+            if kwargs.get("check"):
+                result.check_returncode()
+        return result
+
+    def check_output(self, args: Any, **kwargs: Any) -> Any:
+        """Run a command like `subprocess.check_output`, reusing captured results."""
+        if "stdout" in kwargs:
+            raise ValueError("stdout argument not allowed, it will be overridden.")
+        return self.run(args, stdout=subprocess.PIPE, check=True, **kwargs).stdout
+
+
+class ParallelRunner:
+    """Runs several commands at once, for generators that need many outputs.
+
+    Calling the runner with a list of commands runs them in a thread pool and
+    returns their outputs in the same order as the commands. Commands are run
+    with `check_output`, so a failing command raises once every command has
+    finished.
+    """
+
+    def __init__(
+        self,
+        subprocess_module: Any = subprocess,
+        limit: int | None = None,
+        timeout: float | None = None,
+    ):
+        self.subprocess = subprocess_module
+        self.limit = limit or os.cpu_count() or 1
+        self.timeout = timeout
+
+    def __call__(self, commands: Iterable[Any], **kwargs: Any) -> list[Any]:
+        """Run commands concurrently and return their outputs in order.
+
+        Args:
+            commands: Commands, each as an argument list or a string
+            **kwargs: Passed to `check_output` for every command. Output is
+                text unless `text=False` is given.
+
+        Returns:
+            The output of each command
+        """
+        commands = list(commands)
+        kwargs.setdefault("text", True)
+        kwargs.setdefault("timeout", self.timeout)
+        if not commands:
+            return []
+        workers = min(self.limit, len(commands))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(self.subprocess.check_output, command, **kwargs)
+                for command in commands
+            ]
+        return [future.result() for future in futures]
+
+
+def _git(*args: str) -> str | None:
+    """Run a git command, returning its output, or None if it fails."""
+    try:
+        result = subprocess.run(
+            ["git", *args], check=True, capture_output=True, text=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+class RepositoryFacts:
+    """Facts about the repository that generators often need.
+
+    Each fact is computed the first time a generator uses it, and then shared
+    by every later block and file. Whatever a fact was computed from is
+    recorded as a dependency of every generator that uses it, just as if the
+    generator had computed it itself.
+
+    If a cache is given, facts are also stored there, keyed by the current git
+    HEAD, and reused while everything they were computed from is unchanged.
+    """
+
+    def __init__(self, cache: DiskCache | None = None):
+        self.cache = cache
+        self._facts: dict[str, tuple[Any, Dependencies]] = {}
+
+    @cached_property
+    def _head(self) -> str | None:
+        with paused():
+            return _git("rev-parse", "HEAD")
+
+    def _key(self, name: str) -> str:
+        identity = json.dumps([FACTS_VERSION, os.path.abspath("."), self._head, name])
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    def _load(self, name: str) -> tuple[Any, Dependencies] | None:
+        if self.cache is None or (stored := self.cache.get(self._key(name))) is None:
+            return None
+        try:
+            entry = json.loads(stored)
+            with paused():
+                if not is_current(entry["dependencies"]):
+                    return None
+            return entry["value"], Dependencies.from_snapshot(entry["dependencies"])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def _store(self, name: str, value: Any, dependencies: Dependencies) -> None:
+        if self.cache is None:
+            return
+        with paused():
+            entry = {"value": value, "dependencies": snapshot(dependencies)}
+        try:
+            encoded = json.dumps(entry).encode()
+        except TypeError:
+            # Values such as TOML dates can't be stored, so are recomputed
+            return
+        self.cache.put(self._key(name), encoded)
+
+    def _fact(self, name: str, compute: Callable[[], Any]) -> Any:
+        if name not in self._facts:
+            fact = self._load(name)
+            if fact is None:
+                with recording() as dependencies:
+                    value = compute()
+                self._store(name, value, dependencies)
+                fact = value, dependencies
+            self._facts[name] = fact
+        value, dependencies = self._facts[name]
+        record(dependencies)
+        return value
+
+    @property
+    def files(self) -> list[str]:
+        """Every file in the repository, sorted, using `/` as the separator."""
+        return self._fact("files", lambda: sorted(list_repository_files()))
+
+    @property
+    def pyproject(self) -> dict[str, Any]:
+        """The contents of `pyproject.toml`, or an empty dict if there isn't one."""
+
+        def load() -> dict[str, Any]:
+            try:
+                with open("pyproject.toml", "rb") as f:
+                    return tomllib.load(f)
+            except FileNotFoundError:
+                return {}
+
+        return self._fact("pyproject", load)
+
+    @property
+    def git_head(self) -> str | None:
+        """The commit id of git's HEAD, or None outside a repository."""
+        return self._fact("git_head", lambda: _git("rev-parse", "HEAD"))
+
+    @property
+    def tag(self) -> str | None:
+        """The most recent tag reachable from HEAD, or None if there isn't one."""
+        return self._fact("tag", lambda: _git("describe", "--tags", "--abbrev=0"))
+
+    @property
+    def version(self) -> str | None:
+        """The project's version from `pyproject.toml`, or else its latest tag.
+
+        A tag's leading `v` is removed, so `v1.2.3` is reported as `1.2.3`.
+        """
+
+        def find() -> str | None:
+            version = self.pyproject.get("project", {}).get("version")
+            if version is None and (tag := self.tag) is not None:
+                version = tag.removeprefix("v")
+            return version
+
+        return self._fact("version", find)
+
+    @property
+    def workspace_members(self) -> list[str]:
+        """The directories of the project's uv workspace members, sorted."""
+
+        def find() -> list[str]:
+            workspace = (
+                self.pyproject.get("tool", {}).get("uv", {}).get("workspace", {})
+            )
+            excluded = {
+                os.path.normpath(path)
+                for pattern in workspace.get("exclude", [])
+                for path in glob.glob(pattern)
+            }
+            members = {
+                os.path.normpath(path)
+                for pattern in workspace.get("members", [])
+                for path in glob.glob(pattern)
+                if os.path.isfile(os.path.join(path, "pyproject.toml"))
+            }
+            return sorted(path.replace(os.sep, "/") for path in members - excluded)
+
+        return self._fact("workspace_members", find)
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import time
+from collections.abc import Generator, Iterable
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+
+from andrewaylett_pre_commit_hooks import logger
+from andrewaylett_pre_commit_hooks.cache import DiskCache
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+
+def _child_cpu_seconds() -> float:
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+@dataclass
+class Timing:
+    """How long something took.
+
+    `child_seconds` is the CPU time used by child processes that finished
+    in the meantime, such as commands run through `subprocess`.
+    """
+
+    name: str
+    seconds: float = 0.0
+    child_seconds: float = 0.0
+
+
+@contextmanager
+def timed(name: str) -> Generator[Timing, None, None]:
+    """Time the block, filling in the yielded Timing when it exits."""
+    timing = Timing(name)
+    start = time.perf_counter()
+    child_start = _child_cpu_seconds()
+    try:
+        yield timing
+    finally:
+        timing.seconds = time.perf_counter() - start
+        timing.child_seconds = _child_cpu_seconds() - child_start
+
+
+class DurationHistory:
+    """How long each file took to process, as of the last time it was processed.
+
+    The history for the current directory is stored as a single cache entry.
+    """
+
+    def __init__(self, cache: DiskCache):
+        self.cache = cache
+        identity = f"durations\0{os.path.abspath('.')}"
+        self.key = hashlib.sha256(identity.encode()).hexdigest()
+        self.durations: dict[str, float] = {}
+        if (stored := cache.get(self.key)) is not None:
+            try:
+                self.durations = {
+                    str(file): float(seconds)
+                    for file, seconds in json.loads(stored).items()
+                }
+            except (ValueError, AttributeError, TypeError):
+                logger.debug("Ignoring unreadable duration history")
+
+    def schedule(self, files: Iterable[str]) -> list[str]:
+        """Order files so that those expected to take longest come first.
+
+        Files without a history are expected to take the mean of those with one,
+        and files expected to take the same time keep their relative order. With
+        no history at all, the order is unchanged.
+        """
+        files = list(files)
+        if not self.durations:
+            return files
+        mean = sum(self.durations.values()) / len(self.durations)
+        return sorted(files, key=lambda file: -self.durations.get(file, mean))
+
+    def update(self, timings: Iterable[Timing]) -> None:
+        """Record the latest durations, and forget files that no longer exist."""
+        for timing in timings:
+            self.durations[timing.name] = timing.seconds
+        self.durations = {
+            file: seconds
+            for file, seconds in self.durations.items()
+            if os.path.exists(file)
+        }
+        self.cache.put(self.key, json.dumps(self.durations, sort_keys=True).encode())
+
+
+def report_timings(
+    files: list[Timing],
+    blocks: list[Timing],
+    slowest: int = 0,
+    report_path: str | None = None,
+    block_budget: float | None = None,
+) -> None:
+    """Report how long files and generator blocks took.
+
+    Args:
+        files: Timings for each file
+        blocks: Timings for each generator block
+        slowest: Log this many of the slowest files and blocks
+        report_path: Write every timing to this file as JSON
+        block_budget: Warn about every block that took longer than this
+    """
+    if block_budget is not None:
+        for block in blocks:
+            if block.seconds > block_budget:
+                logger.warning(
+                    f"{block.name} took {block.seconds:.3f}s, "
+                    f"over its budget of {block_budget:.3f}s"
+                )
+
+    if slowest > 0:
+        for kind, timings in (("files", files), ("blocks", blocks)):
+            ranked = sorted(timings, key=lambda t: t.seconds, reverse=True)[:slowest]
+            if not ranked:
+                continue
+            logger.info(f"Slowest {kind}:")
+            for timing in ranked:
+                logger.info(
+                    f"  {timing.seconds:8.3f}s "
+                    f"({timing.child_seconds:.3f}s in child processes) {timing.name}"
+                )
+
+    if report_path is not None:
+        report = {
+            "files": [asdict(timing) for timing in files],
+            "blocks": [asdict(timing) for timing in blocks],
+        }
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
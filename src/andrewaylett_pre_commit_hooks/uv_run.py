@@ -1,16 +1,357 @@
+import argparse
+import codecs
+import hashlib
+import json
 import os
+import shlex
 import subprocess
 import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from typing import IO, TextIO
 
 from andrewaylett_pre_commit_hooks import error_logger, logger
+from andrewaylett_pre_commit_hooks.cache import DEFAULT_MAX_BYTES, DiskCache
+from andrewaylett_pre_commit_hooks.file_index import (
+    list_repository_files,
+    resolve_entries,
+)
 
+# Hook options that don't take a value
+HOOK_FLAGS = frozenset({"--hook-no-cache", "--hook-fast-path", "--hook-shard"})
 
-def run_uv_command(args: list[str], use_exec: bool = False) -> bool:
+# Set to any non-empty value to ignore and not update the result cache
+NO_CACHE_ENV = "PRE_COMMIT_UV_RUN_NO_CACHE"
+
+# Bump to invalidate every cached result
+CACHE_VERSION = "1"
+
+# Records the inputs of the project environment's last successful sync
+STAMP_NAME = ".andrewaylett-pre-commit-hooks-stamp"
+
+# How much of a command's output to repeat if it fails
+DEFAULT_TAIL_BYTES = 4096
+
+# How much output to read from a child process at once
+PUMP_CHUNK = 64 * 1024
+
+# Room left on each command line for uv run's own additions to the environment
+ARG_HEADROOM = 4096
+
+# Used where the system doesn't say how long a command line may be
+FALLBACK_ARG_MAX = 32 * 1024
+
+# Where a virtual environment keeps its executables
+BIN_DIR = "Scripts" if os.name == "nt" else "bin"
+
+
+def _file_digest(path: str) -> str | None:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    except OSError:
+        return None
+
+
+def python_identity() -> str:
+    """Identify the interpreter that `uv run` will use.
+
+    Falls back to this process's Python version if uv can't find one.
+    """
+    try:
+        result = subprocess.run(
+            ["uv", "python", "find"],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        return os.path.realpath(result.stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return sys.version
+
+
+class ResultCache:
+    """Successful results of commands, keyed by the command and its inputs.
+
+    A command's inputs are the files matching the configured globs, `uv.lock`,
+    and the interpreter `uv run` will use. They're fingerprinted by content,
+    once per instance.
+    """
+
+    def __init__(self, inputs: list[str], cache: DiskCache | None = None):
+        self.inputs = inputs
+        self.cache = cache or DiskCache("uv-run")
+
+    @cached_property
+    def fingerprint(self) -> str:
+        """Digest of the current state of every input."""
+        files = sorted(resolve_entries(self.inputs, list_repository_files()))
+        state = {
+            "version": CACHE_VERSION,
+            "cwd": os.path.abspath("."),
+            "files": {path: _file_digest(path) for path in files},
+            "lock": _file_digest("uv.lock"),
+            "python": python_identity(),
+        }
+        return hashlib.sha256(json.dumps(state, sort_keys=True).encode()).hexdigest()
+
+    def _key(self, args: list[str], mode: str) -> str:
+        identity = json.dumps([self.fingerprint, mode, args])
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    def get(self, args: list[str], mode: str = "") -> dict[str, str] | None:
+        """Return the output of a previous successful run, if there was one.
+
+        Args:
+            args: Arguments passed to uv run
+            mode: Distinguishes ways of running a command that output differently
+
+        Returns:
+            The run's `stdout` and `stderr`, or None
+        """
+        if (stored := self.cache.get(self._key(args, mode))) is None:
+            return None
+        try:
+            result = json.loads(stored)
+            return {"stdout": str(result["stdout"]), "stderr": str(result["stderr"])}
+        except (ValueError, KeyError, TypeError):
+            logger.debug("Ignoring unreadable cached result")
+            return None
+
+    def put(self, args: list[str], stdout: str, stderr: str, mode: str = "") -> None:
+        """Record the output of a successful run."""
+        result = {"stdout": stdout, "stderr": stderr}
+        self.cache.put(self._key(args, mode), json.dumps(result).encode())
+
+
+def project_environment() -> str:
+    """Return the path of the project's virtual environment, as uv would."""
+    return os.environ.get("UV_PROJECT_ENVIRONMENT") or ".venv"
+
+
+def environment_stamp(venv: str) -> str | None:
+    """Fingerprint the inputs `uv run` syncs a project environment from.
+
+    These are `uv.lock`, `pyproject.toml`, `.python-version`, and the
+    environment's interpreter.
+
+    Returns:
+        The fingerprint, or None if the project has no lock file or environment
+    """
+    lock = _file_digest("uv.lock")
+    pyproject = _file_digest("pyproject.toml")
+    config = _file_digest(os.path.join(venv, "pyvenv.cfg"))
+    python = os.path.join(venv, BIN_DIR, "python")
+    if lock is None or pyproject is None or config is None:
+        return None
+    state = {
+        "lock": lock,
+        "pyproject": pyproject,
+        "python-version": _file_digest(".python-version"),
+        "pyvenv.cfg": config,
+        "python": os.path.realpath(python),
+    }
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode()).hexdigest()
+
+
+def _read_stamp(venv: str) -> str | None:
+    try:
+        with open(os.path.join(venv, STAMP_NAME)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def sync_environment(venv: str) -> bool:
+    """Sync the project environment as `uv run` would, and stamp it.
+
+    Returns:
+        True if the environment was synced and stamped
+    """
+    try:
+        result = subprocess.run(["uv", "sync", "--inexact"], check=False)
+    except OSError as e:
+        logger.debug(f"Could not run uv sync: {e}")
+        return False
+    if result.returncode != 0 or (stamp := environment_stamp(venv)) is None:
+        return False
+    try:
+        with open(os.path.join(venv, STAMP_NAME), "w") as f:
+            f.write(stamp + "\n")
+    except OSError as e:
+        logger.debug(f"Could not write environment stamp: {e}")
+        return False
+    return True
+
+
+def exec_from_environment(args: list[str]) -> bool:
+    """Replace the current process with a tool from the project environment.
+
+    This skips `uv run`'s check that the environment matches the lock file, as
+    long as the environment's stamp shows that nothing has changed since it was
+    last synced. Otherwise, the environment is synced and stamped first.
+
+    Only plain commands installed in the environment of a project rooted in
+    the current directory are run this way: uv options, scripts, and projects
+    without `uv.lock` or `pyproject.toml` here are left to `uv run`.
+
+    Returns:
+        False if the command must be run with `uv run` instead
+        Note: If the tool is run, this function will not return
+    """
+    if (
+        not args
+        or args[0].startswith("-")
+        or args[0].endswith(".py")
+        or os.sep in args[0]
+    ):
+        return False
+    if not (os.path.isfile("uv.lock") and os.path.isfile("pyproject.toml")):
+        return False
+    venv = project_environment()
+    current = environment_stamp(venv)
+    if current is None or _read_stamp(venv) != current:
+        logger.info("Project environment may be stale, syncing it")
+        if not sync_environment(venv):
+            return False
+
+    tool = os.path.join(venv, BIN_DIR, args[0])
+    if not os.access(tool, os.X_OK):
+        return False
+
+    # Set up the environment as uv run would
+    env = dict(os.environ)
+    env["VIRTUAL_ENV"] = os.path.abspath(venv)
+    env["PATH"] = os.pathsep.join(
+        [os.path.abspath(os.path.join(venv, BIN_DIR)), env.get("PATH", os.defpath)]
+    )
+    env.pop("PYTHONHOME", None)
+    logger.info(f"Running: {' '.join(args)} (from {venv})")
+    try:
+        os.execve(tool, args, env)
+        # This line will only be reached in tests when os.execve is mocked
+        # noinspection PyUnreachableCode
+        return True
+    except OSError as e:
+        logger.debug(f"Could not exec {tool}: {e}")
+        return False
+
+
+class OutputTail:
+    """The last bytes of a command's output, kept in a ring buffer of chunks.
+
+    Chunks are only decoded when the tail is asked for.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_TAIL_BYTES):
+        self.max_bytes = max_bytes
+        self._chunks: deque[bytes] = deque()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def append(self, chunk: bytes) -> None:
+        """Add a chunk of output, dropping chunks that are no longer needed."""
+        if self.max_bytes <= 0:
+            return
+        with self._lock:
+            self._chunks.append(chunk)
+            self._size += len(chunk)
+            while self._size - len(self._chunks[0]) >= self.max_bytes:
+                self._size -= len(self._chunks.popleft())
+
+    def text(self) -> str:
+        """Return the last `max_bytes` of output, decoded."""
+        with self._lock:
+            data = b"".join(self._chunks)
+        return data[-self.max_bytes :].decode(errors="replace") if data else ""
+
+
+def _pump(
+    source: IO[bytes],
+    target: TextIO,
+    tail: OutputTail,
+    kept: list[bytes] | None,
+) -> None:
+    """Copy a child's output to one of our streams as it arrives."""
+    buffer: IO[bytes] | None = getattr(target, "buffer", None)
+    encoding = getattr(target, "encoding", None) or "utf-8"
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    with source:
+        # Read whatever is available, rather than waiting for a full chunk
+        while chunk := os.read(source.fileno(), PUMP_CHUNK):
+            if buffer is not None:
+                buffer.write(chunk)
+                buffer.flush()
+            else:
+                target.write(decoder.decode(chunk))
+                target.flush()
+            tail.append(chunk)
+            if kept is not None:
+                kept.append(chunk)
+    if buffer is None:
+        target.write(decoder.decode(b"", final=True))
+        target.flush()
+
+
+def stream_command(
+    command: list[str],
+    tail_bytes: int = DEFAULT_TAIL_BYTES,
+    kept: tuple[list[bytes], list[bytes]] | None = None,
+) -> tuple[int, str]:
+    """Run a command, copying its stdout and stderr to ours as they arrive.
+
+    Only the end of the output is kept in memory, unless asked for all of it.
+
+    Args:
+        command: The command to run
+        tail_bytes: How much of the end of the output to keep
+        kept: Lists to add every chunk of stdout and stderr to, if wanted
+
+    Returns:
+        The command's exit code, and the end of its output
+    """
+    tail = OutputTail(tail_bytes)
+    # Anything we've printed ourselves must come before the command's output
+    sys.stdout.flush()
+    sys.stderr.flush()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    pumps = [
+        threading.Thread(
+            target=_pump,
+            args=(pipe, target, tail, None if kept is None else kept[index]),
+            daemon=True,
+        )
+        for index, (pipe, target) in enumerate(
+            ((process.stdout, sys.stdout), (process.stderr, sys.stderr))
+        )
+    ]
+    for pump in pumps:
+        pump.start()
+    for pump in pumps:
+        pump.join()
+    return process.wait(), tail.text()
+
+
+def run_uv_command(
+    args: list[str],
+    use_exec: bool = False,
+    results: ResultCache | None = None,
+    tail_bytes: int = DEFAULT_TAIL_BYTES,
+) -> bool:
     """Run a command using uv run.
 
+    Without exec, the command's output is streamed to ours as it arrives, and
+    the end of it is repeated if the command fails.
+
     Args:
         args: Arguments to pass to uv run
         use_exec: If True, use os.execvp to replace the current process with uv
+        results: Replay a previous successful run instead, if there is one, and
+            record a successful run otherwise. Disables use_exec, as the
+            output must be captured.
+        tail_bytes: How much of the end of the output to repeat on failure
 
     Returns:
         True if the command succeeded, False otherwise
@@ -21,9 +362,16 @@ def run_uv_command(args: list[str], use_exec: bool = False) -> bool:
         return False
 
     command = ["uv", "run", *args]
+
+    if results is not None and (cached := results.get(args)) is not None:
+        logger.info(f"Reusing cached result of: {' '.join(command)}")
+        print(cached["stdout"], end="")
+        print(cached["stderr"], end="", file=sys.stderr)
+        return True
+
     logger.info(f"Running: {' '.join(command)}")
 
-    if use_exec:
+    if use_exec and results is None:
         try:
             # Replace the current process with uv
             # This will not return if successful
@@ -36,25 +384,24 @@ def run_uv_command(args: list[str], use_exec: bool = False) -> bool:
             return False
     else:
         try:
-            # Run the command and capture output
-            result = subprocess.run(
-                command,
-                check=False,
-                capture_output=True,
-                text=True,
+            # Only keep all of the output if it's to be cached
+            kept: tuple[list[bytes], list[bytes]] | None = (
+                None if results is None else ([], [])
             )
-
-            # Print the output
-            if result.stdout:
-                print(result.stdout, end="")
-            if result.stderr:
-                print(result.stderr, end="", file=sys.stderr)
+            returncode, tail = stream_command(command, tail_bytes, kept)
 
             # Check if the command succeeded
-            if result.returncode != 0:
-                error_logger.error(f"Command failed with exit code {result.returncode}")
+            if returncode != 0:
+                error_logger.error(f"Command failed with exit code {returncode}")
+                if tail:
+                    error_logger.error(f"The end of its output was:\n{tail}")
                 return False
 
+            if results is not None and kept is not None:
+                stdout, stderr = (
+                    b"".join(chunks).decode(errors="replace") for chunks in kept
+                )
+                results.put(args, stdout, stderr)
             return True
 
         except Exception as e:
@@ -62,16 +409,301 @@ def run_uv_command(args: list[str], use_exec: bool = False) -> bool:
             return False
 
 
+def _run_buffered(
+    args: list[str], results: ResultCache | None = None
+) -> tuple[int, str, bool]:
+    """Run a command with uv run.
+
+    Returns:
+        The exit code, the combined output, and whether it was a cached result
+    """
+    if results is not None and (cached := results.get(args, "combined")) is not None:
+        return 0, cached["stdout"], True
+    try:
+        result = subprocess.run(
+            ["uv", "run", *args],
+            check=False,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+    except Exception as e:
+        return 1, f"Error running uv command: {e}\n", False
+    output = result.stdout or ""
+    if results is not None and result.returncode == 0:
+        results.put(args, output, "", "combined")
+    return result.returncode, output, False
+
+
+def run_uv_commands(
+    commands: list[list[str]],
+    jobs: int | None = None,
+    results: ResultCache | None = None,
+) -> bool:
+    """Run several commands at once using uv run.
+
+    Each command's output, with stderr merged into stdout, is buffered and then
+    printed as a single block, in the order the commands were given.
+
+    Args:
+        commands: The arguments to pass to uv run for each command
+        jobs: How many commands to run at once, or None for one per CPU
+        results: Replay previous successful runs, and record new ones
+
+    Returns:
+        True if every command succeeded, False otherwise
+    """
+    if not commands or not all(commands):
+        error_logger.error("Error: No command specified for uv run")
+        return False
+
+    workers = min(jobs or os.cpu_count() or 1, len(commands))
+    failures = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_buffered, args, results) for args in commands]
+        for args, future in zip(commands, futures, strict=True):
+            returncode, output, cached = future.result()
+            action = "Reusing cached result of" if cached else "Running"
+            logger.info(f"{action}: {shlex.join(['uv', 'run', *args])}")
+            print(output, end="", flush=True)
+            if returncode != 0:
+                error_logger.error(f"Command failed with exit code {returncode}")
+                failures += 1
+
+    if failures:
+        error_logger.error(f"Error: {failures} of {len(commands)} commands failed")
+        return False
+    return True
+
+
+def select_files(filenames: list[str], patterns: list[str]) -> list[str]:
+    """Return the filenames matching the patterns, in their original order.
+
+    Patterns are applied like `.cogfiles` entries, so `!`-prefixed patterns
+    exclude files matched by earlier ones. With no patterns, every file matches.
+    """
+    if not patterns:
+        return filenames
+    selected = resolve_entries(patterns, filenames)
+    return [filename for filename in filenames if filename in selected]
+
+
+def _arg_bytes(arg: str) -> int:
+    # The argument, its terminator, and its pointer in argv
+    return len(os.fsencode(arg)) + 1 + 8
+
+
+def argument_budget(commands: list[list[str]]) -> int:
+    """Return how many bytes of filenames may be added to any of the commands.
+
+    This is the system's limit on the size of a new process's arguments and
+    environment, less the current environment, the longest command, and some
+    headroom.
+    """
+    try:
+        arg_max = os.sysconf("SC_ARG_MAX")
+    except (AttributeError, ValueError, OSError):
+        arg_max = -1
+    if arg_max <= 0:
+        arg_max = FALLBACK_ARG_MAX
+    environment = sum(
+        _arg_bytes(f"{name}={value}") for name, value in os.environ.items()
+    )
+    command = max(
+        (sum(_arg_bytes(arg) for arg in ["uv", "run", *args]) for args in commands),
+        default=0,
+    )
+    return arg_max - environment - command - ARG_HEADROOM
+
+
+def shard_filenames(filenames: list[str], shards: int, budget: int) -> list[list[str]]:
+    """Split filenames into consecutive shards, like `xargs -P` would.
+
+    Files are spread evenly over the requested number of shards, and any shard
+    that wouldn't fit within the budget is split further.
+
+    Args:
+        filenames: The files to split
+        shards: How many shards to aim for
+        budget: The most bytes of filenames a single shard may take
+
+    Returns:
+        The shards, none of which is empty
+    """
+    if not filenames:
+        return []
+    per_shard = -(-len(filenames) // max(1, min(shards, len(filenames))))
+    result: list[list[str]] = []
+    current: list[str] = []
+    size = 0
+    for filename in filenames:
+        cost = _arg_bytes(filename)
+        if current and (len(current) == per_shard or size + cost > budget):
+            result.append(current)
+            current, size = [], 0
+        current.append(filename)
+        size += cost
+    result.append(current)
+    return result
+
+
+def split_hook_args(argv: list[str]) -> tuple[list[str], list[str]]:
+    """Split the hook's own options from the command to run.
+
+    Hook options all start with `--hook-`, and are only recognised before the
+    command. An optional `--` ends them explicitly.
+
+    Returns:
+        The hook options, and the command's arguments
+    """
+    index = 0
+    while index < len(argv) and argv[index].startswith("--hook-"):
+        option = argv[index]
+        index += 1
+        if "=" not in option and option not in HOOK_FLAGS:
+            # The option's value is the next argument
+            index += 1
+    hook_args, command = argv[:index], argv[index:]
+    if command[:1] == ["--"]:
+        command = command[1:]
+    return hook_args, command
+
+
+def positive_int(value: str) -> int:
+    """Parse an argument that must be a whole number greater than zero."""
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got {value!r}")
+    return number
+
+
+def parse_hook_args(argv: list[str]) -> argparse.Namespace:
+    """Parse the hook's own options."""
+    parser = argparse.ArgumentParser(
+        prog="pre-commit-uv-run",
+        usage="%(prog)s [--hook-OPTION ...] [--] COMMAND [ARG ...]",
+        description="Execute a project command using uv run.",
+    )
+    parser.add_argument(
+        "--hook-command",
+        action="append",
+        default=[],
+        metavar="COMMAND",
+        help="A command line to run, split like a shell would. May be repeated to "
+        "run several commands at once; any other arguments are appended to each",
+    )
+    parser.add_argument(
+        "--hook-jobs",
+        type=positive_int,
+        metavar="N",
+        help="Run at most N commands at once (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--hook-cache-input",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Reuse the output of a successful run until a matching tracked file, "
+        "uv.lock, or the Python interpreter changes. May be repeated",
+    )
+    parser.add_argument(
+        "--hook-no-cache",
+        action="store_true",
+        help=f"Ignore and don't update the result cache (or set {NO_CACHE_ENV})",
+    )
+    parser.add_argument(
+        "--hook-cache-size",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        metavar="MIB",
+        help="Maximum size of the result cache in MiB (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--hook-files",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Treat the arguments as filenames, and only pass on those matching "
+        "GLOB. May be repeated, and `!GLOB` excludes files. Requires --hook-command",
+    )
+    parser.add_argument(
+        "--hook-shard",
+        action="store_true",
+        help="Treat the arguments as filenames, and split them into shards that "
+        "each run every command, at most --hook-jobs at once. Requires --hook-command",
+    )
+    parser.add_argument(
+        "--hook-tail-bytes",
+        type=int,
+        default=DEFAULT_TAIL_BYTES,
+        metavar="N",
+        help="When the hook runs a command itself and it fails, repeat the last N "
+        "bytes of its output (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--hook-fast-path",
+        action="store_true",
+        help="Run the tool straight from the project environment while uv.lock, "
+        "pyproject.toml and the interpreter are unchanged since it was last synced",
+    )
+    return parser.parse_args(argv)
+
+
 def main() -> None:
     """Execute a project command using uv run."""
     # Get arguments from command line, skipping the script name
-    args = sys.argv[1:]
+    hook_args, args = split_hook_args(sys.argv[1:])
+    options = parse_hook_args(hook_args)
+
+    results = None
+    if (
+        options.hook_cache_input
+        and not options.hook_no_cache
+        and not os.environ.get(NO_CACHE_ENV)
+    ):
+        results = ResultCache(
+            options.hook_cache_input,
+            DiskCache("uv-run", max_bytes=options.hook_cache_size * 1024 * 1024),
+        )
+
+    if options.hook_files or options.hook_shard:
+        if not options.hook_command:
+            error_logger.error(
+                "Error: --hook-files and --hook-shard require --hook-command"
+            )
+            sys.exit(1)
+        lines = [shlex.split(line) for line in options.hook_command]
+        files = select_files(args, options.hook_files)
+        if not files:
+            logger.info("No matching files, so nothing to run")
+            return
+        shards = [files]
+        if options.hook_shard:
+            jobs = options.hook_jobs or os.cpu_count() or 1
+            shards = shard_filenames(files, jobs, argument_budget(lines))
+        commands = [[*line, *shard] for line in lines for shard in shards]
+        success = run_uv_commands(commands, jobs=options.hook_jobs, results=results)
+    elif options.hook_command:
+        commands = [[*shlex.split(line), *args] for line in options.hook_command]
+        success = run_uv_commands(commands, jobs=options.hook_jobs, results=results)
+    elif results is not None:
+        success = run_uv_command(
+            args, results=results, tail_bytes=options.hook_tail_bytes
+        )
+    elif options.hook_fast_path and exec_from_environment(args):
+        success = True
+    else:
+        # Use exec by default in the main function
+        # This will replace the current process with uv
+        success = run_uv_command(args, use_exec=True)
 
-    # Use exec by default in the main function
-    # This will replace the current process with uv
-    success = run_uv_command(args, use_exec=True)
+    if results is not None:
+        results.cache.evict()
 
-    # This will only be reached if use_exec=True fails
+    # When using exec, this will only be reached if it fails
     if not success:
         sys.exit(1)
 
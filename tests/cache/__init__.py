@@ -0,0 +1 @@
+"""Tests for the on-disk cache."""
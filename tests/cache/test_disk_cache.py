@@ -0,0 +1,68 @@
+"""Unit tests for DiskCache."""
+
+import os
+import time
+
+from andrewaylett_pre_commit_hooks import cache
+from andrewaylett_pre_commit_hooks.cache import DiskCache, cache_dir
+
+
+def test_cache_dir_uses_xdg_cache_home(isolated_cache):
+    """Test that caches live under $XDG_CACHE_HOME."""
+    assert cache_dir("cog") == isolated_cache / "andrewaylett-pre-commit-hooks" / "cog"
+
+
+def test_get_missing_key():
+    """Test that a missing key returns None."""
+    assert DiskCache("test").get("missing") is None
+
+
+def test_put_then_get():
+    """Test that a stored value can be read back."""
+    cache = DiskCache("test")
+    cache.put("key", b"value")
+
+    assert cache.get("key") == b"value"
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    """Test that eviction keeps the most recently used entries within the limit."""
+    cache = DiskCache("test", max_bytes=10, directory=tmp_path)
+    for i, key in enumerate(["old", "middle", "new"]):
+        cache.put(key, b"12345")
+        os.utime(tmp_path / key, ns=(i * 10**9, i * 10**9))
+
+    removed = cache.evict()
+
+    assert removed == 1
+    assert cache.get("old") is None
+    assert cache.get("middle") == b"12345"
+    assert cache.get("new") == b"12345"
+
+
+def test_evict_removes_entries_older_than_max_age(tmp_path):
+    """Test that eviction removes entries unused for longer than max_age."""
+    cache = DiskCache("test", directory=tmp_path)
+    now = time.time_ns()
+    for key, age in [("stale", 120), ("fresh", 30)]:
+        cache.put(key, b"12345")
+        then = now - age * 10**9
+        os.utime(tmp_path / key, ns=(then, then))
+
+    removed = cache.evict(max_age=60)
+
+    assert removed == 1
+    assert cache.get("stale") is None
+    assert cache.get("fresh") == b"12345"
+
+
+def test_keep_in_memory(tmp_path, monkeypatch):
+    """Test that entries seen once are served from memory afterwards."""
+    monkeypatch.setattr(cache, "_memory", None)
+    cache.keep_in_memory()
+    store = DiskCache("test", directory=tmp_path)
+    store.put("key", b"value")
+    (tmp_path / "key").unlink()
+
+    assert store.get("key") == b"value"
+    assert DiskCache("test", directory=tmp_path).get("key") == b"value"
@@ -0,0 +1,139 @@
+"""Tests for the cog result cache."""
+
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.cache import DiskCache
+from andrewaylett_pre_commit_hooks.cog import FileResult, main, run_cog_on_files
+from andrewaylett_pre_commit_hooks.file_index import refs_state, tree_state
+
+# Mark all tests in this module to change directory
+pytestmark = pytest.mark.change_dir
+
+
+@pytest.fixture
+def cog_file(temp_dir, cog_content, create_file):
+    """Create a test file with cog markers in the temporary directory."""
+    return create_file(cog_content, temp_dir, "with_cog.py")
+
+
+def test_cache_hit_skips_processing(cog_file):
+    """Test that a file cog has already processed is skipped on the next run."""
+    cache = DiskCache("cog")
+    assert run_cog_on_files({str(cog_file)}, cache=cache) is True
+
+    with patch("andrewaylett_pre_commit_hooks.cog.process_file") as mock_process:
+        assert run_cog_on_files({str(cog_file)}, cache=cache) is True
+
+    mock_process.assert_not_called()
+
+
+def test_changed_file_misses_cache(cog_file, cog_content):
+    """Test that editing a file causes cog to run on it again."""
+    cache = DiskCache("cog")
+    run_cog_on_files({str(cog_file)}, cache=cache)
+
+    with open(cog_file, "w") as f:
+        f.write(cog_content.replace("generated by cog", "regenerated by cog"))
+    run_cog_on_files({str(cog_file)}, cache=cache)
+
+    with open(cog_file) as f:
+        assert "print('This content was regenerated by cog!')" in f.read()
+
+
+def test_failed_file_is_not_cached(temp_dir, create_file):
+    """Test that a file cog fails on is retried on the next run."""
+    cache = DiskCache("cog")
+    broken = create_file("# [[[cog\n# ]]]\n", temp_dir, "broken.py")
+
+    assert run_cog_on_files({str(broken)}, cache=cache) is False
+    assert run_cog_on_files({str(broken)}, cache=cache) is False
+
+
+@pytest.mark.parametrize("second_run", [[], ["--cache", "--no-cache"]])
+def test_main_without_cache(temp_dir, cog_file, cogfiles_file, second_run):
+    """Test that main runs cog on every file unless --cache is given."""
+    main(["--cache"])
+
+    with patch("andrewaylett_pre_commit_hooks.cog.process_file") as mock_process:
+        mock_process.return_value = FileResult(file="with_cog.py")
+        main(second_run)
+
+    mock_process.assert_called_once()
+
+
+def test_main_cache(temp_dir, cog_file, cogfiles_file):
+    """Test that --cache makes main skip files it has already processed."""
+    main(["--cache"])
+
+    with patch("andrewaylett_pre_commit_hooks.cog.process_file") as mock_process:
+        main(["--cache"])
+
+    mock_process.assert_not_called()
+
+
+def test_changed_dependency_misses_cache(temp_dir, create_file):
+    """Test that a file is processed again when a file its generator read changes."""
+    cache = DiskCache("cog")
+    create_file("first\n", temp_dir, "data.txt")
+    cog_file = create_file(
+        "[[[cog cog.out(pl.Path('data.txt').read_text()) ]]]\n[[[end]]]\n",
+        temp_dir,
+        "generated.txt",
+    )
+    run_cog_on_files({str(cog_file)}, cache=cache)
+
+    create_file("second\n", temp_dir, "data.txt")
+    run_cog_on_files({str(cog_file)}, cache=cache)
+
+    with open(cog_file) as f:
+        assert "second\n" in f.read()
+
+
+def test_changed_module_misses_cache_for_every_importer(temp_dir, create_file):
+    """Test that every file importing an edited module is processed again."""
+    cache = DiskCache("cog")
+    create_file('VALUE = "one"\n', temp_dir, "helper.py")
+    block = "[[[cog import helper; cog.outl(helper.VALUE) ]]]\n[[[end]]]\n"
+    files = {str(create_file(block, temp_dir, name)) for name in ("a.md", "b.md")}
+    try:
+        run_cog_on_files(files, cache=cache)
+
+        # As if in a new process, with the module edited
+        del sys.modules["helper"]
+        create_file('VALUE = "three"\n', temp_dir, "helper.py")
+        run_cog_on_files(files, cache=cache)
+    finally:
+        sys.modules.pop("helper", None)
+
+    for file in files:
+        with open(file) as f:
+            assert "three\n" in f.read()
+
+
+def test_repository_state_is_computed_once_per_run(temp_dir, create_file):
+    """Test that git is asked for the repository's state once per run, not per file."""
+    cache = DiskCache("cog")
+    block = "[[[cog sp.run(['true']) ]]]\n[[[end]]]\n"
+    files = {str(create_file(block, temp_dir, f"{name}.md")) for name in "abc"}
+    subprocess.run(["git", "init"], check=True, capture_output=True)
+    subprocess.run(["git", "add", *files], check=True, capture_output=True)
+
+    with (
+        patch(
+            "andrewaylett_pre_commit_hooks.dependencies.tree_state", wraps=tree_state
+        ) as mock_tree,
+        patch(
+            "andrewaylett_pre_commit_hooks.dependencies.refs_state", wraps=refs_state
+        ) as mock_refs,
+    ):
+        run_cog_on_files(files, cache=cache)
+        assert (mock_tree.call_count, mock_refs.call_count) == (1, 1)
+
+        with patch("andrewaylett_pre_commit_hooks.cog.process_file") as mock_process:
+            run_cog_on_files(files, cache=cache)
+        mock_process.assert_not_called()
+        assert (mock_tree.call_count, mock_refs.call_count) == (2, 2)
@@ -0,0 +1,75 @@
+"""Tests for only processing the cog files affected by a commit."""
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.cog import (
+    declared_dependencies,
+    main,
+    select_changed_files,
+)
+
+# Mark all tests in this module to change directory
+pytestmark = pytest.mark.change_dir
+
+
+@pytest.fixture
+def dependent_content():
+    """Return content for a file whose generator declares dependencies."""
+    return """<!-- [ [ [cog
+# cog-depends: src/**/*.py pyproject.toml -->
+cog.outl(pl.Path("pyproject.toml").read_text())
+]]] -->
+<!-- [[[end]]] -->
+""".replace("[ [ [", "[[[")
+
+
+@pytest.fixture
+def dependent_file(temp_dir, dependent_content, create_file):
+    """Create a file with declared dependencies in the temporary directory."""
+    return create_file(dependent_content, temp_dir, "README.md")
+
+
+def test_declared_dependencies(dependent_file):
+    """Test that cog-depends declarations are found and comment ends dropped."""
+    assert declared_dependencies(str(dependent_file)) == [
+        "src/**/*.py",
+        "pyproject.toml",
+    ]
+
+
+def test_select_changed_files_includes_changed_file(dependent_file):
+    """Test that a cog file is selected when it changed itself."""
+    files = {"README.md", "other.md"}
+
+    assert select_changed_files(files, ["README.md"]) == {"README.md"}
+
+
+def test_select_changed_files_includes_dependents(dependent_file):
+    """Test that a cog file is selected when one of its dependencies changed."""
+    files = {"README.md"}
+
+    assert select_changed_files(files, ["src/pkg/module.py"]) == {"README.md"}
+    assert select_changed_files(files, ["./pyproject.toml"]) == {"README.md"}
+    assert select_changed_files(files, ["setup.py"]) == set()
+
+
+def test_select_changed_files_with_changed_cogfiles(dependent_file):
+    """Test that every file is selected when .cogfiles itself changed."""
+    files = {"README.md", "other.md"}
+
+    assert select_changed_files(files, [".cogfiles"]) == files
+    assert select_changed_files(files, ["packages/a/.cogfiles"]) == files
+
+
+def test_main_changed_only(temp_dir, cog_content, create_file):
+    """Test that main leaves unaffected files alone with --changed-only."""
+    for name in ["changed.py", "unchanged.py"]:
+        create_file(cog_content, temp_dir, name)
+    create_file("changed.py\nunchanged.py\n", temp_dir, ".cogfiles")
+
+    main(["--changed-only", "changed.py", "unrelated.txt"])
+
+    with open("changed.py") as f:
+        assert f.read() != cog_content
+    with open("unchanged.py") as f:
+        assert f.read() == cog_content
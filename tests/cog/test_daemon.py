@@ -0,0 +1,187 @@
+"""Tests for the cog daemon and its client."""
+
+import socket
+import sys
+import threading
+
+import pytest
+
+from andrewaylett_pre_commit_hooks import cache, cog_daemon
+
+# Mark all tests in this module to change directory
+pytestmark = pytest.mark.change_dir
+
+
+@pytest.fixture
+def socket_path(tmp_path, monkeypatch):
+    """Point the client at a socket in the test's directory."""
+    path = str(tmp_path / "cog.sock")
+    monkeypatch.setenv(cog_daemon.SOCKET_ENV, path)
+    monkeypatch.delenv(cog_daemon.NO_DAEMON_ENV, raising=False)
+    return path
+
+
+@pytest.fixture
+def daemon(socket_path, monkeypatch):
+    """Run a cog daemon in a background thread."""
+    # Don't leak the daemon's in-memory caches into other tests
+    monkeypatch.setattr(cache, "_memory", None)
+    server = cog_daemon.make_server(socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def cog_file(temp_dir, cog_content, create_file):
+    """Create a README.md with cog markers."""
+    return create_file(cog_content, temp_dir, "README.md")
+
+
+def test_request_without_daemon_returns_none(socket_path):
+    """Test that the client reports when no daemon is listening."""
+    assert cog_daemon.request([]) is None
+
+
+def test_daemon_runs_cog_in_client_directory(daemon, cog_file, capsys):
+    """Test that the daemon processes the client's files and returns output."""
+    status = cog_daemon.request([])
+
+    assert status == 0
+    with open(cog_file) as f:
+        assert "print('This content was generated by cog!')" in f.read()
+    assert "Running cog on 1 files..." in capsys.readouterr().out
+
+
+def test_daemon_reports_failure(daemon, temp_dir, create_file, capsys):
+    """Test that a failing run's exit status and errors reach the client."""
+    create_file("# [[[cog\n# ]]]\n", temp_dir, "README.md")
+
+    status = cog_daemon.request([])
+
+    assert status == 1
+    assert "Error processing README.md" in capsys.readouterr().err
+
+
+def test_second_daemon_refuses_to_start(daemon, socket_path):
+    """Test that a daemon won't take over a socket that's in use."""
+    with pytest.raises(RuntimeError, match="already listening"):
+        cog_daemon.make_server(socket_path)
+
+
+def test_stale_socket_is_replaced(socket_path, monkeypatch):
+    """Test that a socket left behind by a dead daemon is removed."""
+    monkeypatch.setattr(cache, "_memory", None)
+    with cog_daemon.make_server(socket_path):
+        pass
+
+    with cog_daemon.make_server(socket_path) as server:
+        assert server.server_address == socket_path
+
+
+def test_client_falls_back_to_running_cog(socket_path, cog_file, monkeypatch):
+    """Test that the client runs cog itself when no daemon is listening."""
+    monkeypatch.setattr(sys, "argv", ["pre-commit-cog"])
+
+    cog_daemon.client_main()
+
+    with open(cog_file) as f:
+        assert "print('This content was generated by cog!')" in f.read()
+
+
+def test_client_skips_daemon_when_asked(daemon, cog_file, monkeypatch):
+    """Test that --no-daemon runs cog in-process even with a daemon running."""
+    monkeypatch.setattr(sys, "argv", ["pre-commit-cog", "--no-daemon"])
+    monkeypatch.setattr(
+        cog_daemon, "request", lambda argv: pytest.fail("daemon was used")
+    )
+
+    cog_daemon.client_main()
+
+    with open(cog_file) as f:
+        assert "print('This content was generated by cog!')" in f.read()
+
+
+def test_daemon_sees_edited_modules(daemon, temp_dir, create_file):
+    """Test that modules imported by generators are reloaded for each request."""
+    create_file('VALUE = "one"\n', temp_dir, "helper.py")
+    readme = create_file(
+        "[[[cog import helper; cog.outl(helper.VALUE) ]]]\n[[[end]]]\n",
+        temp_dir,
+        "README.md",
+    )
+    assert cog_daemon.request([]) == 0
+
+    create_file('VALUE = "three"\n', temp_dir, "helper.py")
+    assert cog_daemon.request([]) == 0
+
+    with open(readme) as f:
+        assert "three\n" in f.read()
+    assert "helper" not in sys.modules
+
+
+def test_daemon_sees_client_environment(daemon, temp_dir, create_file, monkeypatch):
+    """Test that generators run by the daemon see the client's environment."""
+    monkeypatch.setenv("COG_TEST_VALUE", "from the client")
+    readme = create_file(
+        "[[[cog cog.outl(os.environ['COG_TEST_VALUE']) ]]]\n[[[end]]]\n",
+        temp_dir,
+        "README.md",
+    )
+
+    assert cog_daemon.request([]) == 0
+
+    with open(readme) as f:
+        assert "from the client\n" in f.read()
+
+
+def test_client_ignores_shared_socket(daemon, socket_path, tmp_path, caplog):
+    """Test that the client won't use a socket other users could have made."""
+    tmp_path.chmod(0o755)
+    try:
+        assert cog_daemon.is_private(socket_path) is False
+        assert cog_daemon.request([]) is None
+    finally:
+        tmp_path.chmod(0o700)
+    assert "isn't private" in caplog.text
+
+
+def test_daemon_refuses_shared_directory(tmp_path, monkeypatch):
+    """Test that the daemon won't listen in a directory others can access."""
+    monkeypatch.setattr(cache, "_memory", None)
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o777)
+    shared.chmod(0o777)
+
+    with pytest.raises(RuntimeError, match="nobody else"):
+        cog_daemon.make_server(str(shared / "cog.sock"))
+
+
+def test_unresponsive_daemon_times_out(socket_path, monkeypatch, caplog):
+    """Test that the client fails if the daemon never answers."""
+    monkeypatch.setattr(cog_daemon, "REQUEST_TIMEOUT", 0.1)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen()
+
+        assert cog_daemon.request([]) == 1
+    assert "didn't finish within 0.1 seconds" in caplog.text
+
+
+def test_daemon_refuses_mismatched_client(
+    daemon, cog_file, cog_content, monkeypatch, caplog
+):
+    """Test that a daemon started from other code won't serve a client."""
+    original = cog_daemon.identity()
+    monkeypatch.setattr(
+        cog_daemon, "identity", lambda: {**original, "version": "0.0.0"}
+    )
+
+    assert cog_daemon.request([]) is None
+
+    with open(cog_file) as f:
+        assert f.read() == cog_content
+    assert "restart it" in caplog.text
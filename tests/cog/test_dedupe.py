@@ -0,0 +1,76 @@
+"""Tests for running identical generator blocks only once."""
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.cog import CogSettings, run_cog_on_files
+
+# Mark all tests in this module to change directory
+pytestmark = pytest.mark.change_dir
+
+SHARED_BLOCK = """[[[cog
+with open("counter", "a") as counter:
+    counter.write("x")
+cog.outl("Shared header")
+]]]
+[[[end]]]
+"""
+
+
+@pytest.fixture
+def shared_files(temp_dir, create_file):
+    """Create several files containing the same generator block."""
+    return [str(create_file(SHARED_BLOCK, temp_dir, f"file_{i}.md")) for i in range(3)]
+
+
+def test_identical_blocks_run_once(shared_files, caplog):
+    """Test that an identical block is run once and spliced into every file."""
+    success = run_cog_on_files(set(shared_files), settings=CogSettings(dedupe=True))
+
+    assert success is True
+    with open("counter") as f:
+        assert f.read() == "x"
+    for file in shared_files:
+        with open(file) as f:
+            assert "Shared header\n" in f.read()
+    assert "2 deduplicated block executions" in caplog.text
+
+
+def test_identical_blocks_run_once_across_workers(shared_files):
+    """Test that workers share the results of deduplicated blocks."""
+    run_cog_on_files(set(shared_files), jobs=2, settings=CogSettings(dedupe=True))
+
+    with open("counter") as f:
+        assert len(f.read()) < len(shared_files)
+
+
+def test_blocks_are_not_deduplicated_by_default(shared_files):
+    """Test that every block runs unless deduplication is enabled."""
+    run_cog_on_files(set(shared_files))
+
+    with open("counter") as f:
+        assert f.read() == "x" * len(shared_files)
+
+
+def test_globals_set_by_deduplicated_blocks_are_replayed(temp_dir, create_file):
+    """Test that later blocks can use globals set by a deduplicated block."""
+    content = (
+        "[[[cog value = 42 ]]]\n[[[end]]]\n[[[cog cog.outl(str(value)) ]]]\n[[[end]]]\n"
+    )
+    files = [str(create_file(content, temp_dir, f"file_{i}.md")) for i in range(2)]
+
+    assert run_cog_on_files(set(files), settings=CogSettings(dedupe=True)) is True
+    for file in files:
+        with open(file) as f:
+            assert "42\n" in f.read()
+
+
+def test_file_specific_blocks_always_run(temp_dir, create_file):
+    """Test that blocks that refer to their own file are not deduplicated."""
+    content = "[[[cog cog.outl(cog.inFile) ]]]\n[[[end]]]\n"
+    files = [str(create_file(content, temp_dir, f"file_{i}.md")) for i in range(2)]
+
+    run_cog_on_files(set(files), settings=CogSettings(dedupe=True))
+
+    for file in files:
+        with open(file) as f:
+            assert f"{file}\n" in f.read()
@@ -1,8 +1,13 @@
 """Tests for finding files with cog markers."""
 
+import subprocess
+from pathlib import Path
+from unittest.mock import patch
+
 import pytest
 
-from andrewaylett_pre_commit_hooks.cog import find_cog_files
+from andrewaylett_pre_commit_hooks.cache import DiskCache
+from andrewaylett_pre_commit_hooks.cog import find_cog_files, resolve_cogfiles
 
 # Mark all tests in this module to change directory
 pytestmark = pytest.mark.change_dir
@@ -36,3 +41,77 @@ def test_find_cog_files_with_readme(temp_dir, readme_file):
     # Check that only README is found
     assert len(files) == 1
     assert "README" in files
+
+
+def test_find_cog_files_with_patterns(temp_dir, create_file, cog_content):
+    """Test that .cogfiles entries can be globs, directories and excludes."""
+    (Path(temp_dir) / "docs" / "api").mkdir(parents=True)
+    for path in ["README.md", "docs/index.md", "docs/api/reference.md", "notes.txt"]:
+        create_file(cog_content, temp_dir, path)
+    create_file("**/*.md\n!docs/api/\nnotes.txt\n", temp_dir, ".cogfiles")
+
+    files = find_cog_files()
+
+    assert files == {"README.md", "docs/index.md", "notes.txt"}
+
+
+def test_find_cog_files_with_bracketed_literal(temp_dir, create_file, cog_content):
+    """Test that a literal path containing brackets isn't treated as a glob."""
+    (Path(temp_dir) / "pages").mkdir()
+    for path in ["pages/[slug].md", "pages/s.md", "a.md"]:
+        create_file(cog_content, temp_dir, path)
+    create_file("pages/[slug].md\n[ab].md\n", temp_dir, ".cogfiles")
+
+    files = find_cog_files()
+
+    assert files == {"pages/[slug].md", "a.md"}
+
+
+def test_resolve_cogfiles_is_cached_by_tree_state(temp_dir, create_file, cog_content):
+    """Test that resolved patterns are reused until the git index changes."""
+    subprocess.run(["git", "init"], check=True, capture_output=True)
+    create_file(cog_content, temp_dir, "a.md")
+    subprocess.run(["git", "add", "a.md"], check=True, capture_output=True)
+    cache = DiskCache("cog")
+
+    assert resolve_cogfiles(["*.md"], cache) == {"a.md"}
+    with patch(
+        "andrewaylett_pre_commit_hooks.cog.list_repository_files"
+    ) as mock_listing:
+        assert resolve_cogfiles(["*.md"], cache) == {"a.md"}
+    mock_listing.assert_not_called()
+
+    create_file(cog_content, temp_dir, "b.md")
+    subprocess.run(["git", "add", "b.md"], check=True, capture_output=True)
+    assert resolve_cogfiles(["*.md"], cache) == {"a.md", "b.md"}
+
+
+def test_find_cog_files_recursive(temp_dir, create_file, cog_content):
+    """Test that nested .cogfiles are used, relative to their own directory."""
+    for directory in ["packages/a/docs", "packages/b"]:
+        (Path(temp_dir) / directory).mkdir(parents=True)
+    for path in [
+        "README.md",
+        "packages/a/README.md",
+        "packages/a/docs/guide.md",
+        "packages/b/README.md",
+    ]:
+        create_file(cog_content, temp_dir, path)
+    create_file("README.md\ndocs/*.md\n", temp_dir, "packages/a/.cogfiles")
+    create_file("README.md\n", temp_dir, "packages/b/.cogfiles")
+
+    assert find_cog_files() == {"README.md"}
+    assert find_cog_files(recursive=True) == {
+        "README.md",
+        "packages/a/README.md",
+        "packages/a/docs/guide.md",
+        "packages/b/README.md",
+    }
+
+
+def test_find_cog_files_recursive_without_top_level(temp_dir, create_file):
+    """Test that nested .cogfiles are enough on their own."""
+    (Path(temp_dir) / "pkg").mkdir()
+    create_file("notes.txt\n", temp_dir, "pkg/.cogfiles")
+
+    assert find_cog_files(recursive=True) == {"pkg/notes.txt"}
@@ -0,0 +1,94 @@
+"""Tests for rerunning only the generator blocks that changed."""
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.cog import CogSettings, run_cog_on_files
+
+# Mark all tests in this module to change directory
+pytestmark = pytest.mark.change_dir
+
+INCREMENTAL = CogSettings(incremental=True)
+
+
+def block(name: str, text: str | None = None) -> str:
+    """Return a block that logs its name when it runs and outputs text."""
+    return (
+        f"[[[cog open('runs.log', 'a').write('{name}\\n'); "
+        f"cog.outl('{text or name}') ]]]\n[[[end]]]\n"
+    )
+
+
+def runs(temp_dir) -> list[str]:
+    """Return the names of the blocks that have run, and forget them."""
+    with open(f"{temp_dir}/runs.log") as f:
+        names = f.read().split()
+    open(f"{temp_dir}/runs.log", "w").close()
+    return names
+
+
+def regenerate(path) -> bool:
+    """Run cog incrementally on a single file, without the file cache."""
+    return run_cog_on_files({str(path)}, settings=INCREMENTAL)
+
+
+def test_only_changed_blocks_run(temp_dir, create_file, caplog):
+    """Test that editing one block's source only reruns that block."""
+    cog_file = create_file(block("a") + block("b") + block("c"), temp_dir, "doc.md")
+    assert regenerate(cog_file) is True
+    assert runs(temp_dir) == ["a", "b", "c"]
+
+    with open(cog_file) as f:
+        content = f.read()
+    with open(cog_file, "w") as f:
+        f.write(content.replace("cog.outl('c')", "cog.outl('C')"))
+
+    assert regenerate(cog_file) is True
+    assert runs(temp_dir) == ["c"]
+    assert "2 unchanged blocks skipped" in caplog.text
+    with open(cog_file) as f:
+        content = f.read()
+    assert "\na\n" in content
+    assert "\nC\n" in content
+
+
+def test_later_blocks_rerun_when_an_earlier_one_changes(temp_dir, create_file):
+    """Test that a block reruns when a block before it changes."""
+    cog_file = create_file(block("a") + block("b"), temp_dir, "doc.md")
+    regenerate(cog_file)
+    runs(temp_dir)
+
+    with open(cog_file) as f:
+        content = f.read()
+    with open(cog_file, "w") as f:
+        f.write(content.replace("cog.outl('a')", "cog.outl('A')"))
+
+    regenerate(cog_file)
+    assert runs(temp_dir) == ["a", "b"]
+
+
+def test_blocks_rerun_when_their_inputs_change(temp_dir, create_file):
+    """Test that a block reruns when a file it read changes."""
+    create_file("one", temp_dir, "data.txt")
+    reader = "[[[cog cog.outl(open('data.txt').read()) ]]]\n[[[end]]]\n"
+    cog_file = create_file(block("a") + reader, temp_dir, "doc.md")
+    regenerate(cog_file)
+    runs(temp_dir)
+
+    create_file("two", temp_dir, "data.txt")
+    regenerate(cog_file)
+
+    assert runs(temp_dir) == []
+    with open(cog_file) as f:
+        assert "\ntwo\n" in f.read()
+
+
+def test_blocks_after_global_assignments_always_run(temp_dir, create_file):
+    """Test that blocks after one that assigns globals aren't skipped."""
+    setter = "[[[cog open('runs.log', 'a').write('set\\n'); x = 1 ]]]\n[[[end]]]\n"
+    cog_file = create_file(block("a") + setter + block("b"), temp_dir, "doc.md")
+    regenerate(cog_file)
+    runs(temp_dir)
+
+    regenerate(cog_file)
+
+    assert runs(temp_dir) == ["set", "b"]
@@ -0,0 +1,107 @@
+"""Tests for the JSON manifest of what cog changed."""
+
+import json
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.cache import DiskCache
+from andrewaylett_pre_commit_hooks.cog import CogSettings, main, run_cog_on_files
+
+# Mark all tests in this module to change directory
+pytestmark = pytest.mark.change_dir
+
+CONTENT = """Title
+# [[[cog
+# cog.outl('one')
+# ]]]
+# [[[end]]]
+[[[cog cog.outl('two') ]]]
+[[[end]]]
+"""
+
+
+def read_manifest(path):
+    """Load a manifest."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def test_changed_blocks_are_listed_with_new_line_ranges(temp_dir, create_file):
+    """Test that each changed block's output and end marker are listed."""
+    create_file(CONTENT, temp_dir, "doc.md")
+    create_file(CONTENT.replace("outl('one')", "out('')"), temp_dir, "empty.md")
+    manifest_path = f"{temp_dir}/manifest.json"
+
+    run_cog_on_files(
+        {"doc.md", "empty.md"}, settings=CogSettings(manifest=manifest_path)
+    )
+
+    manifest = read_manifest(manifest_path)
+    assert manifest["changed"] == [
+        {"file": "doc.md", "blocks": [{"start": 5, "end": 6}, {"start": 8, "end": 9}]},
+        {"file": "empty.md", "blocks": [{"start": 7, "end": 8}]},
+    ]
+    with open("doc.md") as f:
+        lines = f.read().splitlines()
+    assert lines[4] == "one"
+    assert lines[5].startswith("# [[[end]]]")
+    assert lines[7] == "two"
+    assert lines[8].startswith("[[[end]]]")
+
+
+def test_only_blocks_that_changed_are_listed(temp_dir, create_file):
+    """Test that a block whose output is unchanged isn't listed."""
+    create_file(CONTENT, temp_dir, "doc.md")
+    run_cog_on_files({"doc.md"})
+    with open("doc.md") as f:
+        content = f.read()
+    create_file(content.replace("outl('two')", "outl('2\\n2')"), temp_dir, "doc.md")
+    manifest_path = f"{temp_dir}/manifest.json"
+
+    run_cog_on_files({"doc.md"}, settings=CogSettings(manifest=manifest_path))
+
+    assert read_manifest(manifest_path)["changed"] == [
+        {"file": "doc.md", "blocks": [{"start": 8, "end": 10}]}
+    ]
+
+
+def test_unchanged_cached_and_skipped(temp_dir, create_file, tmp_path):
+    """Test that files and blocks that weren't rewritten are reported."""
+    create_file(CONTENT, temp_dir, "doc.md")
+    create_file(CONTENT, temp_dir, "other.md")
+    cache = DiskCache("cog", directory=tmp_path / "results")
+    settings = CogSettings(incremental=True)
+    run_cog_on_files({"doc.md", "other.md"}, cache=cache, settings=settings)
+    # Touch doc.md so that the file cache misses but its blocks are unchanged
+    with open("doc.md", "a") as f:
+        f.write("More text\n")
+    manifest_path = f"{temp_dir}/manifest.json"
+
+    run_cog_on_files(
+        {"doc.md", "other.md"},
+        cache=cache,
+        settings=CogSettings(incremental=True, manifest=manifest_path),
+    )
+
+    manifest = read_manifest(manifest_path)
+    assert manifest["changed"] == []
+    assert manifest["unchanged"] == ["doc.md"]
+    assert manifest["cached"] == ["other.md"]
+    assert manifest["skipped_blocks"] == [
+        {"file": "doc.md", "line": 2},
+        {"file": "doc.md", "line": 7},
+    ]
+    assert [timing["name"] for timing in manifest["timings"]["files"]] == ["doc.md"]
+
+
+def test_main_with_manifest(temp_dir, create_file):
+    """Test that main writes a manifest, including for failed files."""
+    create_file("[[[cog cog.outl('x') ]]]\n[[[end]]]\n", temp_dir, "README.md")
+
+    main(["--manifest", "manifest.json"])
+
+    manifest = read_manifest("manifest.json")
+    assert manifest["changed"] == [
+        {"file": "README.md", "blocks": [{"start": 2, "end": 3}]}
+    ]
+    assert manifest["failed"] == []
@@ -0,0 +1,57 @@
+"""Tests for running cog across multiple worker processes."""
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.cog import main, run_cog_on_files
+
+# Mark all tests in this module to change directory
+pytestmark = pytest.mark.change_dir
+
+
+@pytest.fixture
+def cog_files(temp_dir, cog_content, create_file):
+    """Create several files with cog markers in the temporary directory."""
+    return [create_file(cog_content, temp_dir, f"file_{i}.py") for i in range(4)]
+
+
+def test_run_cog_on_files_in_parallel(cog_files):
+    """Test that every file is processed when using several workers."""
+    success = run_cog_on_files({str(f) for f in cog_files}, jobs=2)
+
+    assert success is True
+    for cog_file in cog_files:
+        with open(cog_file) as f:
+            assert "print('This content was generated by cog!')" in f.read()
+
+
+def test_parallel_output_is_in_file_order(cog_files, capsys):
+    """Test that buffered cog output is reported in filename order."""
+    run_cog_on_files({str(f) for f in cog_files}, jobs=4)
+
+    out = capsys.readouterr().out
+    positions = [out.index(f"Cogging {f}") for f in cog_files]
+    assert positions == sorted(positions)
+
+
+def test_parallel_errors_are_collected(temp_dir, cog_files, create_file, caplog):
+    """Test that a failing file is reported without stopping the others."""
+    broken = create_file("# [[[cog\n# ]]]\n", temp_dir, "broken.py")
+
+    success = run_cog_on_files({str(f) for f in [*cog_files, broken]}, jobs=2)
+
+    assert success is False
+    assert f"Error processing {broken}" in caplog.text
+    for cog_file in cog_files:
+        with open(cog_file) as f:
+            assert "print('This content was generated by cog!')" in f.read()
+
+
+def test_main_with_jobs(temp_dir, cog_files, create_file):
+    """Test that main accepts a --jobs argument."""
+    create_file("\n".join(f.name for f in cog_files), temp_dir, ".cogfiles")
+
+    main(["--jobs", "0"])
+
+    for cog_file in cog_files:
+        with open(cog_file) as f:
+            assert "print('This content was generated by cog!')" in f.read()
@@ -0,0 +1,29 @@
+"""Tests for the marker prescan."""
+
+from andrewaylett_pre_commit_hooks.cog import has_cog_markers, prescan_cog_files
+
+
+def test_has_cog_markers(cog_file):
+    """Test that a file with cog markers is detected."""
+    assert has_cog_markers(str(cog_file)) is True
+
+
+def test_has_no_cog_markers(temp_dir, no_cog_content, create_file):
+    """Test that a file without cog markers is detected."""
+    no_cog_file = create_file(no_cog_content, temp_dir, "without_cog.py")
+
+    assert has_cog_markers(str(no_cog_file)) is False
+
+
+def test_empty_file_has_no_cog_markers(temp_dir, create_file):
+    """Test that an empty file, which can't be memory-mapped, has no markers."""
+    empty_file = create_file("", temp_dir, "empty.py")
+
+    assert has_cog_markers(str(empty_file)) is False
+
+
+def test_missing_file_is_kept(temp_dir, cog_file):
+    """Test that unreadable files are kept so cog can report the error."""
+    missing = f"{temp_dir}/missing.py"
+
+    assert prescan_cog_files({str(cog_file), missing}) == {str(cog_file), missing}
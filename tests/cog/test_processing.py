@@ -1,7 +1,11 @@
 """Tests for processing files with cog markers."""
 
+import os
+import time
+
 import pytest
 
+from andrewaylett_pre_commit_hooks.cache import DiskCache
 from andrewaylett_pre_commit_hooks.cog import main, run_cog_on_files
 
 # Mark all tests in this module to change directory
@@ -39,7 +43,7 @@ def test_run_cog_on_files(cog_file):
 def test_main_with_cogfiles(temp_dir, cog_file, cogfiles_file):
     """Test the main function with .cogfiles."""
     # Run the main function
-    main()
+    main([])
 
     # Read the processed file
     with open(cog_file) as f:
@@ -52,7 +56,7 @@ def test_main_with_cogfiles(temp_dir, cog_file, cogfiles_file):
 def test_main_with_readme_md(temp_dir, readme_md_file):
     """Test the main function with README.md."""
     # Run the main function
-    main()
+    main([])
 
     # Read the processed file
     with open(readme_md_file) as f:
@@ -65,7 +69,7 @@ def test_main_with_readme_md(temp_dir, readme_md_file):
 def test_main_with_readme(temp_dir, readme_file):
     """Test the main function with README."""
     # Run the main function
-    main()
+    main([])
 
     # Read the processed file
     with open(readme_file) as f:
@@ -73,3 +77,99 @@ def test_main_with_readme(temp_dir, readme_file):
 
     # Check that the cog-generated content is present
     assert "print('This content was generated by cog!')" in processed_content
+
+
+def test_run_cog_on_files_skips_files_without_markers(cog_file, no_cog_file, caplog):
+    """Test that files without cog markers are dropped before running cog."""
+    success = run_cog_on_files({str(cog_file), str(no_cog_file)})
+
+    assert success is True
+    assert "Skipping 1 files without cog markers" in caplog.text
+    assert "Running cog on 1 files..." in caplog.text
+
+
+def test_main_with_memoized_subprocess(temp_dir, create_file, caplog):
+    """Test that generators share the output of identical commands."""
+    block = (
+        "[[[cog cog.outl(sp.check_output(['echo', 'hi'], text=True)) ]]]\n[[[end]]]\n"
+    )
+    create_file(block * 3, temp_dir, "README.md")
+
+    main(["--memoize-subprocess"])
+
+    assert "2 subprocess cache hits, 1 subprocess cache misses" in caplog.text
+
+
+def test_main_evicts_expired_subprocess_results(temp_dir, create_file):
+    """Test that shared command output older than the TTL is removed."""
+    cache = DiskCache("subprocess")
+    cache.put("expired", b"{}")
+    then = time.time_ns() - 120 * 10**9
+    os.utime(cache.directory / "expired", ns=(then, then))
+    create_file(
+        "[[[cog cog.outl(sp.check_output(['echo', 'hi'], text=True)) ]]]\n[[[end]]]\n",
+        temp_dir,
+        "README.md",
+    )
+
+    main(["--memoize-subprocess", "--subprocess-ttl", "60"])
+
+    assert cache.get("expired") is None
+    assert len(os.listdir(cache.directory)) == 1
+
+
+def test_main_with_define_module(temp_dir, create_file):
+    """Test that extra modules are available to generators under their names."""
+    create_file(
+        "[[[cog cog.outl(js.dumps([tomllib.__name__])) ]]]\n[[[end]]]\n",
+        temp_dir,
+        "README.md",
+    )
+
+    main(["--define-module", "js=json", "--define-module", "tomllib"])
+
+    with open("README.md") as f:
+        assert '["tomllib"]' in f.read()
+
+
+def test_define_module_rejects_invalid_names():
+    """Test that a malformed --define-module is reported as a usage error."""
+    with pytest.raises(SystemExit):
+        main(["--define-module", "not a name=json"])
+
+
+def test_main_with_cog_parallel(temp_dir, create_file):
+    """Test that generators can run commands concurrently with cog_parallel."""
+    create_file(
+        "[[[cog\n"
+        "for out in cog_parallel([['echo', str(i)] for i in range(5)]):\n"
+        "    cog.out(out)\n"
+        "]]]\n[[[end]]]\n",
+        temp_dir,
+        "README.md",
+    )
+
+    main(["--parallel-limit", "2", "--parallel-timeout", "10"])
+
+    with open("README.md") as f:
+        assert "\n0\n1\n2\n3\n4\n" in f.read()
+
+
+@pytest.mark.parametrize("limit", ["0", "-1", "two"])
+def test_parallel_limit_must_be_positive(limit, capsys):
+    """Test that --parallel-limit below one is reported as a usage error."""
+    with pytest.raises(SystemExit):
+        main(["--parallel-limit", limit])
+
+    assert "expected a positive integer" in capsys.readouterr().err
+
+
+def test_main_with_repository_facts(temp_dir, create_file):
+    """Test that generators can use facts about the repository."""
+    create_file("[project]\nversion = '0.1.0'\n", temp_dir, "pyproject.toml")
+    create_file("[[[cog cog.outl(repo.version) ]]]\n[[[end]]]\n", temp_dir, "README.md")
+
+    main(["--persist-repo-facts"])
+
+    with open("README.md") as f:
+        assert "\n0.1.0\n" in f.read()
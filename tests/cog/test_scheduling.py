@@ -0,0 +1,70 @@
+"""Tests for scheduling the slowest cog files first."""
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.cache import DiskCache
+from andrewaylett_pre_commit_hooks.cog import run_cog_on_files
+from andrewaylett_pre_commit_hooks.timing import DurationHistory, Timing
+
+# Mark all tests in this module to change directory
+pytestmark = pytest.mark.change_dir
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """Create a result cache in the test's directory."""
+    return DiskCache("cog", directory=tmp_path / "results")
+
+
+@pytest.fixture
+def files(temp_dir, create_file):
+    """Create files for a history to refer to."""
+    names = ["a.md", "b.md", "c.md", "d.md"]
+    for name in names:
+        create_file("", temp_dir, name)
+    return names
+
+
+def test_no_history_keeps_order(cache, files):
+    """Test that files are scheduled in the given order without a history."""
+    assert DurationHistory(cache).schedule(files) == files
+
+
+def test_longest_first_with_new_files_at_the_mean(cache, files):
+    """Test that known files are ordered by duration, and new ones by the mean."""
+    history = DurationHistory(cache)
+    history.update([Timing("a.md", 1.0), Timing("b.md", 5.0), Timing("c.md", 3.0)])
+
+    assert DurationHistory(cache).schedule(files) == ["b.md", "c.md", "d.md", "a.md"]
+
+
+def test_history_forgets_deleted_files(cache, files, temp_dir):
+    """Test that files which no longer exist are dropped from the history."""
+    DurationHistory(cache).update([Timing("a.md", 1.0), Timing("gone.md", 2.0)])
+
+    assert DurationHistory(cache).durations == {"a.md": 1.0}
+
+
+def test_unreadable_history_is_ignored(cache, files):
+    """Test that a corrupt history doesn't stop scheduling."""
+    history = DurationHistory(cache)
+    cache.put(history.key, b"not json")
+
+    assert DurationHistory(cache).schedule(files) == files
+
+
+def test_parallel_run_records_history(temp_dir, create_file, cog_content, capsys):
+    """Test that a run without --cache records durations, reporting in filename order."""
+    names = [f"file_{i}.py" for i in range(4)]
+    for name in names:
+        create_file(cog_content, temp_dir, name)
+    durations = DiskCache("durations")
+    # Schedule the files in reverse
+    DurationHistory(durations).update([Timing(name, i) for i, name in enumerate(names)])
+
+    assert run_cog_on_files(set(names), jobs=2) is True
+
+    out = capsys.readouterr().out
+    positions = [out.index(f"Cogging {name}") for name in names]
+    assert positions == sorted(positions)
+    assert set(DurationHistory(durations).durations) == set(names)
@@ -0,0 +1,83 @@
+"""Tests for streaming large files through cog."""
+
+import os
+import stat
+import tracemalloc
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.cog import CogSettings, run_cog_on_files
+
+# Mark all tests in this module to change directory
+pytestmark = pytest.mark.change_dir
+
+STREAMING = CogSettings(stream_threshold=0)
+
+
+def test_streamed_output_matches_in_memory_output(temp_dir, cog_content, create_file):
+    """Test that streaming a file produces exactly what cog would."""
+    streamed = create_file(cog_content, temp_dir, "streamed.py")
+    in_memory = create_file(cog_content, temp_dir, "in_memory.py")
+
+    assert run_cog_on_files({str(streamed)}, settings=STREAMING) is True
+    assert run_cog_on_files({str(in_memory)}) is True
+
+    with open(streamed) as s, open(in_memory) as m:
+        assert s.read() == m.read()
+    assert sorted(os.listdir(temp_dir)) == ["in_memory.py", "streamed.py"]
+
+
+def test_streaming_keeps_permissions(temp_dir, cog_content, create_file):
+    """Test that a replaced file keeps its mode."""
+    cog_file = create_file(cog_content, temp_dir, "script.py")
+    os.chmod(cog_file, 0o751)
+
+    run_cog_on_files({str(cog_file)}, settings=STREAMING)
+
+    assert stat.S_IMODE(os.stat(cog_file).st_mode) == 0o751
+
+
+def test_unchanged_file_is_not_replaced(temp_dir, cog_content, create_file, capsys):
+    """Test that a file whose output is unchanged is left alone."""
+    cog_file = create_file(cog_content, temp_dir, "README.md")
+    run_cog_on_files({str(cog_file)}, settings=STREAMING)
+    inode = os.stat(cog_file).st_ino
+    capsys.readouterr()
+
+    run_cog_on_files({str(cog_file)}, settings=STREAMING)
+
+    assert os.stat(cog_file).st_ino == inode
+    out = capsys.readouterr().out
+    assert f"Cogging {cog_file}\n" in out
+    assert "(changed)" not in out
+
+
+def test_failed_stream_leaves_file_alone(temp_dir, create_file, caplog):
+    """Test that an error keeps the original file and removes the temporary one."""
+    content = "# [[[cog\n# cog.outl('partial')\n# raise ValueError('boom')\n# ]]]\n"
+    broken = create_file(content, temp_dir, "broken.py")
+
+    assert run_cog_on_files({str(broken)}, settings=STREAMING) is False
+
+    assert "Error processing" in caplog.text
+    with open(broken) as f:
+        assert f.read() == content
+    assert os.listdir(temp_dir) == ["broken.py"]
+
+
+def test_streaming_memory_is_bounded_by_blocks(temp_dir, create_file):
+    """Test that peak memory doesn't grow with the size of the file."""
+    filler = "unchanging text outside any cog block\n" * 100_000
+    content = filler + "[[[cog cog.outl('generated') ]]]\n[[[end]]]\n" + filler
+    big = create_file(content, temp_dir, "big.txt")
+
+    tracemalloc.start()
+    try:
+        run_cog_on_files({str(big)}, settings=STREAMING)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert peak < len(content) / 4
+    with open(big) as f:
+        assert "\ngenerated\n" in f.read()
@@ -0,0 +1,54 @@
+"""Tests for timing cog files and generator blocks."""
+
+import json
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.cog import CogSettings, main, run_cog_on_files
+
+# Mark all tests in this module to change directory
+pytestmark = pytest.mark.change_dir
+
+SLOW_CONTENT = """[[[cog sp.run(["sleep", "0.2"]) ]]]
+[[[end]]]
+[[[cog cog.outl("fast") ]]]
+[[[end]]]
+"""
+
+
+@pytest.fixture
+def slow_file(temp_dir, create_file):
+    """Create a file with one slow and one fast generator block."""
+    return create_file(SLOW_CONTENT, temp_dir, "README.md")
+
+
+def test_slowest_report(slow_file, caplog):
+    """Test that the slowest blocks are reported, slowest first."""
+    run_cog_on_files({"README.md"}, settings=CogSettings(slowest=2))
+
+    messages = caplog.messages
+    blocks = messages[messages.index("Slowest blocks:") :]
+    assert "README.md:1" in blocks[1]
+    assert "README.md:3" in blocks[2]
+    assert "Slowest files:" in messages
+
+
+def test_timing_report(slow_file):
+    """Test that every file and block is written to the JSON report."""
+    run_cog_on_files({"README.md"}, settings=CogSettings(timing_report="timing.json"))
+
+    with open("timing.json") as f:
+        report = json.load(f)
+    assert [file["name"] for file in report["files"]] == ["README.md"]
+    blocks = {block["name"]: block for block in report["blocks"]}
+    assert blocks["README.md:1"]["seconds"] >= 0.2
+    assert blocks["README.md:1"]["child_seconds"] >= 0
+    assert blocks["README.md:3"]["seconds"] < 0.2
+
+
+def test_block_budget_warning(slow_file, caplog):
+    """Test that blocks over their budget are warned about."""
+    main(["--no-cache", "--block-budget", "0.1"])
+
+    assert "README.md:1 took" in caplog.text
+    assert "README.md:3 took" not in caplog.text
@@ -0,0 +1,73 @@
+"""Tests for verifying generated output checksums without running generators."""
+
+import json
+import os
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.checksums import verify_file, verify_files
+from andrewaylett_pre_commit_hooks.cog import main
+
+# Mark all tests in this module to change directory
+pytestmark = pytest.mark.change_dir
+
+
+@pytest.fixture
+def passing_file(temp_dir, passing_cog_content, create_file):
+    """Create a file whose generated output matches its checksum."""
+    return create_file(passing_cog_content, temp_dir, "passing.py")
+
+
+@pytest.fixture
+def edited_file(temp_dir, passing_cog_content, create_file):
+    """Create a file whose generated output has been edited by hand."""
+    content = passing_cog_content.replace(
+        "    print('Generated Passing')\n", "    print('Edited')\n", 1
+    )
+    return create_file(content, temp_dir, "edited.py")
+
+
+def test_verify_passing_file(passing_file):
+    """Test that a block with a matching checksum passes."""
+    assert verify_file(str(passing_file)) == []
+
+
+def test_verify_edited_file(edited_file):
+    """Test that a hand-edited block is reported at its end marker."""
+    assert verify_file(str(edited_file)) == [
+        {"file": str(edited_file), "line": 8, "reason": "checksum mismatch"}
+    ]
+
+
+def test_verify_missing_checksum(temp_dir, failing_cog_content, create_file):
+    """Test that a block without a checksum is reported."""
+    unchecked = create_file(failing_cog_content, temp_dir, "unchecked.py")
+
+    assert [m["reason"] for m in verify_file(str(unchecked))] == ["missing checksum"]
+
+
+def test_verify_does_not_run_generators(temp_dir, create_file):
+    """Test that generator code is never executed."""
+    content = "[[[cog open('ran', 'w') ]]]\n[[[end]]] (sum: 1B2M2Y8Asg)\n"
+    create_file(content, temp_dir, "README.md")
+
+    assert verify_file("README.md") == []
+    assert not os.path.exists("ran")
+
+
+def test_verify_files_prints_json(passing_file, edited_file, capsys):
+    """Test that failures are printed as JSON lines and the check fails."""
+    assert verify_files({str(passing_file), str(edited_file)}, jobs=2) is False
+
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line)["file"] for line in lines] == [str(edited_file)]
+
+
+def test_main_verify(temp_dir, edited_file, create_file):
+    """Test that main exits non-zero when a checksum doesn't match."""
+    create_file("edited.py\n", temp_dir, ".cogfiles")
+
+    with pytest.raises(SystemExit) as exc_info:
+        main(["--verify"])
+
+    assert exc_info.value.code == 1
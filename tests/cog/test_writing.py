@@ -0,0 +1,68 @@
+"""Tests for how cog writes the files it changes."""
+
+import os
+import stat
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.cog import run_cog_on_files
+
+# Mark all tests in this module to change directory
+pytestmark = pytest.mark.change_dir
+
+
+def test_unchanged_file_is_not_touched(temp_dir, cog_content, create_file, caplog):
+    """Test that a file whose output is unchanged keeps its inode and mtime."""
+    cog_file = create_file(cog_content, temp_dir, "README.md")
+    run_cog_on_files({"README.md"})
+    before = os.stat(cog_file)
+    caplog.clear()
+
+    run_cog_on_files({"README.md"})
+
+    after = os.stat(cog_file)
+    assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+    assert "1 unchanged files not rewritten" in caplog.text
+
+
+def test_changed_file_is_replaced_keeping_its_mode(temp_dir, cog_content, create_file):
+    """Test that a changed file is replaced by a new file with the same mode."""
+    cog_file = create_file(cog_content, temp_dir, "script.py")
+    os.chmod(cog_file, 0o750)
+    inode = os.stat(cog_file).st_ino
+
+    run_cog_on_files({"script.py"})
+
+    assert os.stat(cog_file).st_ino != inode
+    assert stat.S_IMODE(os.stat(cog_file).st_mode) == 0o750
+    with open(cog_file) as f:
+        assert "print('This content was generated by cog!')" in f.read()
+    assert sorted(os.listdir(temp_dir)) == ["script.py"]
+
+
+def test_symlink_target_is_replaced(temp_dir, cog_content, create_file):
+    """Test that writing through a symlink keeps the symlink."""
+    os.mkdir(f"{temp_dir}/real")
+    target = create_file(cog_content, temp_dir, "real/README.md")
+    os.symlink("real/README.md", f"{temp_dir}/README.md")
+
+    run_cog_on_files({"README.md"})
+
+    assert os.path.islink(f"{temp_dir}/README.md")
+    with open(target) as f:
+        assert "print('This content was generated by cog!')" in f.read()
+    assert os.listdir(f"{temp_dir}/real") == ["README.md"]
+
+
+@pytest.mark.skipif(os.geteuid() == 0, reason="root can write read-only files")
+def test_read_only_file_is_reported(temp_dir, cog_content, create_file, caplog):
+    """Test that a file that can't be written fails without being changed."""
+    cog_file = create_file(cog_content, temp_dir, "README.md")
+    os.chmod(cog_file, 0o444)
+
+    assert run_cog_on_files({"README.md"}) is False
+
+    assert "Can't overwrite README.md" in caplog.text
+    with open(cog_file) as f:
+        assert f.read() == cog_content
+    assert os.listdir(temp_dir) == ["README.md"]
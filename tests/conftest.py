@@ -44,3 +44,15 @@ def temp_dir(request):
 
         if change_dir:
             os.chdir(original_dir)
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Point the hooks' on-disk caches at a per-test directory.
+
+    Returns:
+        Path: The directory used as `$XDG_CACHE_HOME`.
+    """
+    cache_home = tmp_path / "cache"
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache_home))
+    return cache_home
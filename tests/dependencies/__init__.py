@@ -0,0 +1 @@
+"""Tests for generator dependency tracking."""
@@ -0,0 +1,160 @@
+"""Unit tests for recording and checking generator dependencies."""
+
+import importlib
+import os
+import py_compile
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.dependencies import (
+    is_current,
+    recording,
+    snapshot,
+)
+
+# Mark all tests in this module to change directory
+pytestmark = pytest.mark.change_dir
+
+
+@pytest.fixture
+def data_file(temp_dir):
+    """Create a data file for generators to read."""
+    path = Path(temp_dir) / "data.txt"
+    path.write_text("original")
+    return path
+
+
+def test_records_reads(data_file):
+    """Test that reads through open and pathlib are recorded."""
+    Path("other.txt").write_text("other")
+
+    with recording() as dependencies:
+        with open("data.txt") as f:
+            f.read()
+        Path("other.txt").read_text()
+        Path("written.txt").write_text("output")
+
+    assert dependencies.reads == {"data.txt", "other.txt"}
+
+
+def test_ignores_files_outside_root(temp_dir, tmp_path):
+    """Test that reads outside the directory cog runs in are not recorded."""
+    outside = tmp_path / "outside.txt"
+    outside.write_text("outside")
+
+    with recording() as dependencies:
+        outside.read_text()
+
+    assert dependencies.reads == set()
+
+
+def test_records_listings_and_commands(temp_dir):
+    """Test that directory listings and commands are recorded."""
+    with recording() as dependencies:
+        os.listdir(".")
+        subprocess.run(["true"], check=True)
+
+    assert dependencies.listings == {"."}
+    assert dependencies.commands == [[".", "true"]]
+
+
+def test_snapshot_detects_changed_file(data_file):
+    """Test that a snapshot is invalidated when a file's content changes."""
+    with recording() as dependencies:
+        data_file.read_text()
+    recorded = snapshot(dependencies)
+
+    assert is_current(recorded) is True
+
+    data_file.write_text("changed content")
+
+    assert is_current(recorded) is False
+
+
+def test_snapshot_ignores_touched_file(data_file):
+    """Test that a file with a new mtime but the same content is still current."""
+    with recording() as dependencies:
+        data_file.read_text()
+    recorded = snapshot(dependencies)
+
+    os.utime(data_file, ns=(0, 0))
+
+    assert is_current(recorded) is True
+
+
+def test_snapshot_detects_new_file_in_listing(temp_dir):
+    """Test that a snapshot is invalidated when a listed directory changes."""
+    with recording() as dependencies:
+        os.listdir(".")
+    recorded = snapshot(dependencies)
+
+    Path("new.txt").write_text("new")
+
+    assert is_current(recorded) is False
+
+
+def test_snapshot_with_commands_outside_git(temp_dir):
+    """Test that generators that ran commands are always rerun outside git."""
+    with recording() as dependencies:
+        subprocess.run(["true"], check=True)
+
+    assert is_current(snapshot(dependencies)) is False
+
+
+def test_snapshot_with_commands_detects_new_tag(temp_dir):
+    """Test that generators that ran commands are rerun when a ref moves."""
+
+    def git(*args):
+        subprocess.run(["git", *args], check=True, capture_output=True)
+
+    git("init")
+    git(
+        "-c",
+        "user.name=Test",
+        "-c",
+        "user.email=test@example.com",
+        "commit",
+        "--allow-empty",
+        "-m",
+        "Initial",
+    )
+    with recording() as dependencies:
+        subprocess.run(["git", "describe", "--always"], check=True, capture_output=True)
+    recorded = snapshot(dependencies)
+    assert is_current(recorded) is True
+
+    git("tag", "v10.0")
+
+    assert is_current(recorded) is False
+
+
+@pytest.fixture
+def helper_module(temp_dir, monkeypatch):
+    """Make a module in the temporary directory importable as `helper`."""
+    Path("helper.py").write_text('VALUE = "one"\n')
+    monkeypatch.syspath_prepend(temp_dir)
+    yield Path(temp_dir) / "helper.py"
+    sys.modules.pop("helper", None)
+
+
+def test_records_modules_imported_from_bytecode(helper_module):
+    """Test that a module imported from fresh bytecode is recorded by source."""
+    py_compile.compile("helper.py")
+
+    with recording() as dependencies:
+        importlib.import_module("helper")
+
+    assert "helper.py" in dependencies.reads
+
+
+def test_records_modules_imported_earlier(helper_module):
+    """Test that a module that was already imported is still recorded."""
+    importlib.import_module("helper")
+
+    with recording() as dependencies:
+        pass
+
+    assert dependencies.reads == {"helper.py"}
@@ -0,0 +1 @@
+"""Tests for the repository file index."""
@@ -0,0 +1,95 @@
+"""Unit tests for file list patterns."""
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.file_index import (
+    compile_pattern,
+    is_pattern,
+    list_repository_files,
+    resolve_entries,
+    tree_state,
+)
+
+FILES = [
+    "README.md",
+    "docs/index.md",
+    "docs/api/reference.md",
+    "docs/api/data.csv",
+    "src/pkg/__init__.py",
+]
+
+
+@pytest.mark.parametrize(
+    ("pattern", "expected"),
+    [
+        ("*.md", ["README.md"]),
+        ("docs/*.md", ["docs/index.md"]),
+        ("**/*.md", ["README.md", "docs/index.md", "docs/api/reference.md"]),
+        ("docs/**", ["docs/index.md", "docs/api/reference.md", "docs/api/data.csv"]),
+        ("docs/", ["docs/index.md", "docs/api/reference.md", "docs/api/data.csv"]),
+        ("docs/api/*.[!m]*", ["docs/api/data.csv"]),
+        ("src/**/__init__.p?", ["src/pkg/__init__.py"]),
+        ("/README.md", ["README.md"]),
+    ],
+)
+def test_compile_pattern(pattern, expected):
+    """Test that globs match the expected paths."""
+    regex = compile_pattern(pattern)
+
+    assert [path for path in FILES if regex.match(path)] == expected
+
+
+def test_is_pattern():
+    """Test that literal paths are distinguished from patterns."""
+    assert is_pattern("README.md") is False
+    assert is_pattern("*.md") is True
+    assert is_pattern("docs/") is True
+    assert is_pattern("!docs/api/data.csv") is True
+
+
+def test_existing_paths_are_literal(temp_dir):
+    """Test that an existing path is literal, even if it looks like a glob."""
+    (Path(temp_dir) / "[slug].md").touch()
+
+    assert is_pattern("[slug].md", temp_dir) is False
+    assert is_pattern("[abc].md", temp_dir) is True
+    assert is_pattern("[slug].md") is True
+    assert resolve_entries(["[slug].md"], ["s.md"], temp_dir) == {"[slug].md"}
+
+
+def test_resolve_entries_applies_excludes_in_order():
+    """Test that excludes remove earlier matches and can be overridden later."""
+    entries = ["**/*.md", "!docs/**", "docs/api/reference.md", "missing.md"]
+
+    assert resolve_entries(entries, FILES) == {
+        "README.md",
+        "docs/api/reference.md",
+        "missing.md",
+    }
+
+
+def test_list_repository_files_walks_without_git(temp_dir):
+    """Test that the directory tree is walked outside a git repository."""
+    (Path(temp_dir) / "sub").mkdir()
+    for path in ["a.md", "sub/b.md"]:
+        (Path(temp_dir) / path).write_text("")
+
+    assert sorted(list_repository_files(temp_dir)) == ["a.md", "sub/b.md"]
+    assert tree_state(temp_dir) is None
+
+
+def test_list_repository_files_uses_git(temp_dir):
+    """Test that only tracked files are listed inside a git repository."""
+    subprocess.run(["git", "init"], cwd=temp_dir, check=True, capture_output=True)
+    for path in ["tracked.md", "untracked.md"]:
+        with open(f"{temp_dir}/{path}", "w") as f:
+            f.write("")
+    subprocess.run(
+        ["git", "add", "tracked.md"], cwd=temp_dir, check=True, capture_output=True
+    )
+
+    assert list_repository_files(temp_dir) == ["tracked.md"]
+    assert tree_state(temp_dir) is not None
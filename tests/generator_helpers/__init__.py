@@ -0,0 +1 @@
+"""Tests for the helpers available to cog generators."""
@@ -0,0 +1,50 @@
+"""Unit tests for LazyModule."""
+
+import sys
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.generator_helpers import LazyModule
+
+
+@pytest.fixture
+def module_name(tmp_path, monkeypatch):
+    """Create an importable module that hasn't been imported yet."""
+    (tmp_path / "lazy_target.py").write_text("VALUE = 42\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "lazy_target", raising=False)
+    yield "lazy_target"
+    sys.modules.pop("lazy_target", None)
+
+
+def test_module_is_imported_on_first_use(module_name):
+    """Test that creating the proxy doesn't import the module, but using it does."""
+    proxy = LazyModule(module_name)
+
+    assert proxy.__name__ == module_name
+    assert module_name not in sys.modules
+    assert proxy.VALUE == 42
+    assert module_name in sys.modules
+
+
+def test_setting_attributes_reaches_the_module(module_name):
+    """Test that attributes set on the proxy are set on the module."""
+    proxy = LazyModule(module_name)
+
+    proxy.VALUE = 7
+
+    assert sys.modules[module_name].VALUE == 7
+
+
+def test_repr_does_not_import(module_name):
+    """Test that the proxy can be displayed without importing the module."""
+    assert repr(LazyModule(module_name)) == "<lazy module 'lazy_target'>"
+    assert module_name not in sys.modules
+
+
+def test_missing_module_fails_on_use():
+    """Test that a module that can't be imported only fails when it's used."""
+    proxy = LazyModule("no_such_module_for_tests")
+
+    with pytest.raises(ModuleNotFoundError):
+        _ = proxy.anything
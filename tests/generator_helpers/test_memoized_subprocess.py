@@ -0,0 +1,86 @@
+"""Unit tests for MemoizedSubprocess."""
+
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.cache import DiskCache
+from andrewaylett_pre_commit_hooks.generator_helpers import MemoizedSubprocess
+
+COMMAND = [sys.executable, "-c", "import uuid; print(uuid.uuid4())"]
+
+
+def test_run_is_memoized():
+    """Test that a captured command only runs once."""
+    memo = MemoizedSubprocess()
+
+    first = memo.run(COMMAND, capture_output=True, text=True)
+    second = memo.run(COMMAND, capture_output=True, text=True)
+
+    assert first.stdout == second.stdout
+    assert (memo.hits, memo.misses) == (1, 1)
+
+
+def test_check_output_is_memoized():
+    """Test that check_output shares results with the same command."""
+    memo = MemoizedSubprocess()
+
+    assert memo.check_output(COMMAND) == memo.check_output(COMMAND)
+    assert (memo.hits, memo.misses) == (1, 1)
+
+
+def test_different_cwd_is_not_shared(tmp_path):
+    """Test that the working directory is part of a command's identity."""
+    memo = MemoizedSubprocess()
+
+    memo.check_output(COMMAND)
+    memo.check_output(COMMAND, cwd=tmp_path)
+
+    assert (memo.hits, memo.misses) == (0, 2)
+
+
+def test_uncaptured_run_is_passed_through():
+    """Test that commands whose output isn't captured always run."""
+    memo = MemoizedSubprocess()
+
+    with patch("andrewaylett_pre_commit_hooks.generator_helpers.subprocess.run") as run:
+        memo.run(["true"])
+        memo.run(["true"])
+
+    assert run.call_count == 2
+    assert (memo.hits, memo.misses) == (0, 0)
+
+
+def test_check_applies_to_memoized_failure():
+    """Test that check=True raises for a cached failing command."""
+    memo = MemoizedSubprocess()
+    failing = [sys.executable, "-c", "import sys; sys.exit(3)"]
+
+    for _ in range(2):
+        with pytest.raises(subprocess.CalledProcessError):
+            memo.run(failing, capture_output=True, check=True)
+
+    assert (memo.hits, memo.misses) == (1, 1)
+
+
+def test_module_attributes_are_available():
+    """Test that the wrapper can stand in for the subprocess module."""
+    memo = MemoizedSubprocess()
+
+    assert memo.PIPE is subprocess.PIPE
+    assert memo.CalledProcessError is subprocess.CalledProcessError
+
+
+def test_results_are_shared_between_runs_within_ttl():
+    """Test that results persist across instances while they're fresh."""
+    cache = DiskCache("subprocess")
+    first = MemoizedSubprocess(cache, ttl=60).check_output(COMMAND)
+
+    fresh = MemoizedSubprocess(cache, ttl=60)
+    expired = MemoizedSubprocess(cache, ttl=-1)
+
+    assert fresh.check_output(COMMAND) == first
+    assert expired.check_output(COMMAND) != first
+    assert (fresh.hits, expired.hits) == (1, 0)
@@ -0,0 +1,86 @@
+"""Unit tests for ParallelRunner."""
+
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.generator_helpers import (
+    MemoizedSubprocess,
+    ParallelRunner,
+)
+
+
+class RecordingSubprocess:
+    """A fake subprocess module that tracks how many commands run at once."""
+
+    def __init__(self):
+        self.running = 0
+        self.most_running = 0
+        self.lock = threading.Lock()
+
+    def check_output(self, command, **kwargs):
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        # Finish later commands first, to check that order is kept
+        time.sleep(0.05 / (1 + int(command[1])))
+        with self.lock:
+            self.running -= 1
+        return f"output {command[1]}"
+
+
+def test_outputs_are_in_input_order():
+    """Test that outputs match the order of the commands, not completion."""
+    runner = ParallelRunner(RecordingSubprocess(), limit=4)
+
+    outputs = runner([["cmd", str(i)] for i in range(6)])
+
+    assert outputs == [f"output {i}" for i in range(6)]
+
+
+def test_limit_bounds_concurrency():
+    """Test that no more than the limit of commands run at once."""
+    fake = RecordingSubprocess()
+    runner = ParallelRunner(fake, limit=2)
+
+    runner([["cmd", str(i)] for i in range(6)])
+
+    assert fake.most_running == 2
+
+
+def test_no_commands():
+    """Test that an empty list of commands is fine."""
+    assert ParallelRunner(limit=2)([]) == []
+
+
+def test_failing_command_raises():
+    """Test that a failing command's error reaches the generator."""
+    runner = ParallelRunner(limit=2)
+
+    with pytest.raises(subprocess.CalledProcessError):
+        runner([[sys.executable, "-c", "print('ok')"], [sys.executable, "-c", "1/0"]])
+
+
+def test_timeout_applies_to_each_command():
+    """Test that the configured timeout stops slow commands."""
+    runner = ParallelRunner(limit=2, timeout=0.2)
+
+    with pytest.raises(subprocess.TimeoutExpired):
+        runner([[sys.executable, "-c", "import time; time.sleep(5)"]])
+
+
+def test_memoized_commands_are_shared():
+    """Test that commands run through a memoizing wrapper are memoized."""
+    memoized = MemoizedSubprocess()
+    runner = ParallelRunner(memoized, limit=2)
+    command = [sys.executable, "-c", "import uuid; print(uuid.uuid4())"]
+
+    first = runner([command])
+    second = runner([command, command])
+
+    assert second == first * 2
+    assert memoized.misses == 1
+    assert memoized.hits == 2
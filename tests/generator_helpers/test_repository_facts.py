@@ -0,0 +1,119 @@
+"""Unit tests for RepositoryFacts."""
+
+import subprocess
+
+import pytest
+
+from andrewaylett_pre_commit_hooks import generator_helpers
+from andrewaylett_pre_commit_hooks.cache import DiskCache
+from andrewaylett_pre_commit_hooks.dependencies import recording
+from andrewaylett_pre_commit_hooks.generator_helpers import RepositoryFacts
+
+PYPROJECT = """
+[project]
+name = "example"
+version = "1.2.3"
+
+[tool.uv.workspace]
+members = ["packages/*"]
+exclude = ["packages/skipped"]
+"""
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """Create a project with two workspace members and one excluded package."""
+    (tmp_path / "pyproject.toml").write_text(PYPROJECT)
+    for name in ("alpha", "beta", "skipped"):
+        (tmp_path / "packages" / name).mkdir(parents=True)
+        (tmp_path / "packages" / name / "pyproject.toml").write_text("")
+    (tmp_path / "packages" / "not-a-package").mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def git(*args):
+    """Run git quietly, with an identity for commits."""
+    subprocess.run(
+        ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com", *args],
+        check=True,
+        capture_output=True,
+    )
+
+
+def test_project_facts(project):
+    """Test the facts read from pyproject.toml."""
+    repo = RepositoryFacts()
+
+    assert repo.pyproject["project"]["name"] == "example"
+    assert repo.version == "1.2.3"
+    assert repo.workspace_members == ["packages/alpha", "packages/beta"]
+    assert "pyproject.toml" in repo.files
+
+
+def test_missing_pyproject(tmp_path, monkeypatch):
+    """Test that a project without pyproject.toml has empty facts."""
+    monkeypatch.chdir(tmp_path)
+    repo = RepositoryFacts()
+
+    assert repo.pyproject == {}
+    assert repo.workspace_members == []
+
+
+def test_facts_are_computed_once(project, monkeypatch):
+    """Test that a fact is only computed the first time it's used."""
+    calls = []
+    monkeypatch.setattr(
+        generator_helpers,
+        "list_repository_files",
+        lambda: calls.append(1) or ["a"],
+    )
+    repo = RepositoryFacts()
+
+    assert repo.files == ["a"]
+    assert repo.files == ["a"]
+    assert len(calls) == 1
+
+
+def test_every_use_records_dependencies(project):
+    """Test that reusing a fact records what it was computed from."""
+    repo = RepositoryFacts()
+    with recording() as first:
+        assert repo.version == "1.2.3"
+    with recording() as second:
+        assert repo.version == "1.2.3"
+
+    assert "pyproject.toml" in first.reads
+    assert "pyproject.toml" in second.reads
+
+
+def test_git_facts(project):
+    """Test the facts read from git."""
+    git("init", "-q")
+    git("add", ".")
+    git("commit", "-q", "-m", "Initial commit")
+    git("tag", "v2.0.0")
+    head = subprocess.run(
+        ["git", "rev-parse", "HEAD"], check=True, capture_output=True, text=True
+    ).stdout.strip()
+    (project / "pyproject.toml").write_text("[project]\nname = 'example'\n")
+    repo = RepositoryFacts()
+
+    assert repo.git_head == head
+    assert repo.tag == "v2.0.0"
+    assert repo.version == "2.0.0"
+    assert repo.files == sorted(repo.files)
+    assert "packages/alpha/pyproject.toml" in repo.files
+
+
+def test_persisted_facts_are_reused_until_inputs_change(project, tmp_path):
+    """Test that a cache shares facts between instances while they're current."""
+    cache = DiskCache("repo", directory=tmp_path / "facts")
+    assert RepositoryFacts(cache).version == "1.2.3"
+
+    with recording() as dependencies:
+        assert RepositoryFacts(cache).version == "1.2.3"
+    assert "pyproject.toml" in dependencies.reads
+
+    (project / "pyproject.toml").write_text("[project]\nversion = '1.3.0'\n")
+    assert RepositoryFacts(cache).version == "1.3.0"
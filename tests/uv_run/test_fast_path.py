@@ -0,0 +1,131 @@
+"""Tests for running tools straight from a stamped project environment."""
+
+import os
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.uv_run import (
+    BIN_DIR,
+    STAMP_NAME,
+    environment_stamp,
+    exec_from_environment,
+    main,
+)
+
+
+@pytest.fixture
+def project(temp_dir, create_file, monkeypatch):
+    """A project with a lock file and an environment containing one tool."""
+    create_file("[project]\nname = 'demo'\n", temp_dir, "pyproject.toml")
+    create_file("version = 1\n", temp_dir, "uv.lock")
+    bin_dir = os.path.join(temp_dir, ".venv", BIN_DIR)
+    os.makedirs(bin_dir)
+    create_file("home = /usr/bin\n", os.path.join(temp_dir, ".venv"), "pyvenv.cfg")
+    create_file("", bin_dir, "python")
+    tool = create_file("#!/bin/sh\n", bin_dir, "mytool")
+    tool.chmod(0o755)
+    monkeypatch.chdir(temp_dir)
+    monkeypatch.delenv("UV_PROJECT_ENVIRONMENT", raising=False)
+    return temp_dir
+
+
+class FakeSync:
+    """Stands in for subprocess.run, counting the times uv sync is run."""
+
+    def __init__(self, returncode=0):
+        self.returncode = returncode
+        self.calls = 0
+
+    def __call__(self, command, **kwargs):
+        assert command == ["uv", "sync", "--inexact"]
+        self.calls += 1
+        return subprocess.CompletedProcess(command, self.returncode)
+
+
+def fast_path(args, sync):
+    with (
+        patch("andrewaylett_pre_commit_hooks.uv_run.subprocess.run", sync),
+        patch("andrewaylett_pre_commit_hooks.uv_run.os.execve") as mock_execve,
+    ):
+        used = exec_from_environment(args)
+    return used, mock_execve
+
+
+def test_stale_environment_is_synced_and_stamped(project):
+    """Test that an unstamped environment is synced once, then used directly."""
+    sync = FakeSync()
+    used, mock_execve = fast_path(["mytool", "--check"], sync)
+
+    assert used is True
+    assert sync.calls == 1
+    with open(os.path.join(".venv", STAMP_NAME)) as f:
+        assert f.read().strip() == environment_stamp(".venv")
+    tool, argv, env = mock_execve.call_args.args
+    assert tool == os.path.join(".venv", BIN_DIR, "mytool")
+    assert argv == ["mytool", "--check"]
+    assert env["VIRTUAL_ENV"] == os.path.abspath(".venv")
+    assert env["PATH"].startswith(os.path.abspath(os.path.join(".venv", BIN_DIR)))
+
+    used, _ = fast_path(["mytool"], sync)
+    assert used is True
+    assert sync.calls == 1
+
+
+@pytest.mark.parametrize("changed", ["uv.lock", "pyproject.toml", ".python-version"])
+def test_changed_inputs_resync(project, create_file, changed):
+    """Test that changing what the environment is synced from syncs it again."""
+    sync = FakeSync()
+    fast_path(["mytool"], sync)
+    create_file("changed\n", project, changed)
+    fast_path(["mytool"], sync)
+
+    assert sync.calls == 2
+
+
+def test_failed_sync_falls_back(project):
+    """Test that uv run is used if the environment can't be synced."""
+    used, mock_execve = fast_path(["mytool"], FakeSync(returncode=1))
+
+    assert used is False
+    mock_execve.assert_not_called()
+    assert not os.path.exists(os.path.join(".venv", STAMP_NAME))
+
+
+@pytest.mark.parametrize(
+    "args", [[], ["--with", "rich", "mytool"], ["script.py"], ["missing"]]
+)
+def test_unsupported_commands_fall_back(project, args):
+    """Test that uv options, scripts and tools not in the environment use uv run."""
+    used, mock_execve = fast_path(args, FakeSync())
+
+    assert used is False
+    mock_execve.assert_not_called()
+
+
+def test_main_fast_path(project, monkeypatch):
+    """Test that main only uses uv run when the fast path can't be used."""
+    monkeypatch.setattr(
+        "andrewaylett_pre_commit_hooks.uv_run.sys.argv",
+        ["pre-commit-uv-run", "--hook-fast-path", "missing"],
+    )
+    with (
+        patch("andrewaylett_pre_commit_hooks.uv_run.subprocess.run", FakeSync()),
+        patch("andrewaylett_pre_commit_hooks.uv_run.os.execvp") as mock_execvp,
+    ):
+        main()
+
+    mock_execvp.assert_called_once_with("uv", ["uv", "run", "missing"])
+
+
+@pytest.mark.parametrize("missing", ["uv.lock", "pyproject.toml"])
+def test_projects_elsewhere_fall_back_without_syncing(project, missing):
+    """Test that uv run is used straight away if the project isn't rooted here."""
+    os.unlink(missing)
+    sync = FakeSync()
+    used, mock_execve = fast_path(["mytool"], sync)
+
+    assert used is False
+    assert sync.calls == 0
+    mock_execve.assert_not_called()
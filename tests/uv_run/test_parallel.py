@@ -0,0 +1,128 @@
+"""Tests for running several commands from one uv-run hook."""
+
+import subprocess
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.uv_run import (
+    main,
+    run_uv_commands,
+    split_hook_args,
+)
+
+
+class FakeRun:
+    """Stands in for subprocess.run, finishing later commands first."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.running = 0
+        self.most_running = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, command, **kwargs):
+        name = command[2]
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        time.sleep(0.05 / (1 + int(name[-1])))
+        with self.lock:
+            self.running -= 1
+        returncode = 1 if name in self.failing else 0
+        return subprocess.CompletedProcess(command, returncode, f"{name} output\n")
+
+
+def test_split_hook_args():
+    """Test that only leading hook options are taken by the hook."""
+    assert split_hook_args(["ruff", "--hook-jobs", "2"]) == (
+        [],
+        ["ruff", "--hook-jobs", "2"],
+    )
+    assert split_hook_args(["--hook-jobs", "2", "--hook-command=ruff", "x"]) == (
+        ["--hook-jobs", "2", "--hook-command=ruff"],
+        ["x"],
+    )
+    assert split_hook_args(["--hook-jobs", "2", "--", "--hook-x"]) == (
+        ["--hook-jobs", "2"],
+        ["--hook-x"],
+    )
+
+
+def test_outputs_are_printed_in_declared_order(capsys):
+    """Test that each command's output is a block, in declaration order."""
+    fake = FakeRun()
+    with patch("andrewaylett_pre_commit_hooks.uv_run.subprocess.run", fake):
+        success = run_uv_commands([[f"tool{i}"] for i in range(4)], jobs=4)
+
+    assert success is True
+    assert capsys.readouterr().out.splitlines() == [f"tool{i} output" for i in range(4)]
+
+
+def test_jobs_limit_concurrency():
+    """Test that no more than the given number of commands run at once."""
+    fake = FakeRun()
+    with patch("andrewaylett_pre_commit_hooks.uv_run.subprocess.run", fake):
+        run_uv_commands([[f"tool{i}"] for i in range(6)], jobs=2)
+
+    assert fake.most_running == 2
+
+
+def test_failures_are_aggregated(caplog):
+    """Test that every command runs, and any failure fails the whole run."""
+    fake = FakeRun(failing={"tool1", "tool2"})
+    with patch("andrewaylett_pre_commit_hooks.uv_run.subprocess.run", fake):
+        success = run_uv_commands([[f"tool{i}"] for i in range(4)])
+
+    assert success is False
+    assert "2 of 4 commands failed" in caplog.text
+
+
+def test_empty_command_fails():
+    """Test that an empty command is an error."""
+    assert run_uv_commands([["ruff"], []]) is False
+
+
+@patch("andrewaylett_pre_commit_hooks.uv_run.run_uv_commands", return_value=True)
+@patch(
+    "andrewaylett_pre_commit_hooks.uv_run.sys.argv",
+    [
+        "pre-commit-uv-run",
+        "--hook-command",
+        "ruff check",
+        "--hook-command=pytest -q",
+        "--hook-jobs",
+        "2",
+        "--",
+        "a.py",
+    ],
+)
+def test_main_with_several_commands(mock_run_uv_commands):
+    """Test that main runs hook commands with the remaining arguments appended."""
+    main()
+
+    mock_run_uv_commands.assert_called_once_with(
+        [["ruff", "check", "a.py"], ["pytest", "-q", "a.py"]], jobs=2, results=None
+    )
+
+
+@pytest.mark.parametrize("jobs", ["0", "-1", "two"])
+def test_main_rejects_jobs_below_one(jobs, capsys):
+    """Test that --hook-jobs must be a positive integer."""
+    argv = ["pre-commit-uv-run", "--hook-command", "ruff check", "--hook-jobs", jobs]
+    with (
+        patch("andrewaylett_pre_commit_hooks.uv_run.sys.argv", argv),
+        pytest.raises(SystemExit),
+    ):
+        main()
+
+    assert "expected a positive integer" in capsys.readouterr().err
+
+
+@patch("andrewaylett_pre_commit_hooks.uv_run.sys.argv", ["pre-commit-uv-run"])
+def test_main_with_no_command(capsys):
+    """Test that main fails without a command."""
+    with pytest.raises(SystemExit):
+        main()
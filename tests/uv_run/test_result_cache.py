@@ -0,0 +1,209 @@
+"""Tests for the uv-run result cache."""
+
+import subprocess
+import sys
+from contextlib import contextmanager
+from unittest.mock import patch
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.cache import DiskCache
+from andrewaylett_pre_commit_hooks.uv_run import (
+    ResultCache,
+    main,
+    run_uv_command,
+    run_uv_commands,
+)
+
+_real_run = subprocess.run
+_real_popen = subprocess.Popen
+
+
+@pytest.fixture
+def project(temp_dir, create_file, monkeypatch):
+    """A directory with some inputs, and a fixed interpreter identity."""
+    create_file("print('hi')\n", temp_dir, "app.py")
+    create_file("notes\n", temp_dir, "README.md")
+    create_file("version = 1\n", temp_dir, "uv.lock")
+    monkeypatch.chdir(temp_dir)
+    monkeypatch.setattr(
+        "andrewaylett_pre_commit_hooks.uv_run.python_identity", lambda: "python"
+    )
+    return temp_dir
+
+
+class FakeRun:
+    """Stands in for subprocess, counting the uv run commands run."""
+
+    def __init__(self, returncode=0):
+        self.returncode = returncode
+        self.calls = 0
+
+    def __call__(self, command, **kwargs):
+        if command[:2] != ["uv", "run"]:
+            return _real_run(command, **kwargs)
+        self.calls += 1
+        return subprocess.CompletedProcess(
+            command, self.returncode, "checked\n", "warning\n"
+        )
+
+    def popen(self, command, **kwargs):
+        if command[:2] != ["uv", "run"]:
+            return _real_popen(command, **kwargs)
+        self.calls += 1
+        script = (
+            "import sys; print('checked'); print('warning', file=sys.stderr); "
+            f"sys.exit({self.returncode})"
+        )
+        return _real_popen([sys.executable, "-c", script], **kwargs)
+
+    @contextmanager
+    def patched(self):
+        with (
+            patch("andrewaylett_pre_commit_hooks.uv_run.subprocess.run", self),
+            patch("andrewaylett_pre_commit_hooks.uv_run.subprocess.Popen", self.popen),
+        ):
+            yield
+
+
+def append(path, text):
+    with open(path, "a") as f:
+        f.write(text)
+
+
+def run(args, fake, **kwargs):
+    with fake.patched():
+        return run_uv_command(args, results=ResultCache(["*.py"]), **kwargs)
+
+
+def test_success_is_replayed(project, capsys):
+    """Test that a repeat run replays the first run's output."""
+    fake = FakeRun()
+    assert run(["pytest"], fake) is True
+    first = capsys.readouterr()
+    assert run(["pytest"], fake) is True
+
+    assert fake.calls == 1
+    second = capsys.readouterr()
+    assert (
+        (second.out, second.err)
+        == (first.out, first.err)
+        == (
+            "checked\n",
+            "warning\n",
+        )
+    )
+
+
+def test_cache_never_execs(project):
+    """Test that a cached command's output is captured rather than exec'd."""
+    fake = FakeRun()
+    with patch("andrewaylett_pre_commit_hooks.uv_run.os.execvp") as mock_execvp:
+        run(["pytest"], fake, use_exec=True)
+
+    mock_execvp.assert_not_called()
+    assert fake.calls == 1
+
+
+def test_failure_is_not_cached(project):
+    """Test that failed runs are always repeated."""
+    fake = FakeRun(returncode=1)
+    assert run(["pytest"], fake) is False
+    assert run(["pytest"], fake) is False
+
+    assert fake.calls == 2
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda: append("app.py", "print('more')\n"),
+        lambda: append("uv.lock", "version = 2\n"),
+    ],
+)
+def test_input_changes_invalidate(project, change):
+    """Test that changing a matching input or the lock file reruns the command."""
+    fake = FakeRun()
+    run(["pytest"], fake)
+    change()
+    run(["pytest"], fake)
+
+    assert fake.calls == 2
+
+
+def test_other_files_and_arguments(project):
+    """Test that unmatched files don't count, and arguments are part of the key."""
+    fake = FakeRun()
+    run(["pytest"], fake)
+    append("README.md", "more notes\n")
+    run(["pytest"], fake)
+    assert fake.calls == 1
+
+    run(["pytest", "-x"], fake)
+    assert fake.calls == 2
+
+
+def test_interpreter_change_invalidates(project, monkeypatch):
+    """Test that a different interpreter reruns the command."""
+    fake = FakeRun()
+    run(["pytest"], fake)
+    monkeypatch.setattr(
+        "andrewaylett_pre_commit_hooks.uv_run.python_identity", lambda: "other"
+    )
+    run(["pytest"], fake)
+
+    assert fake.calls == 2
+
+
+def test_several_commands_are_cached(project, capsys):
+    """Test that each of several commands is replayed separately."""
+    fake = FakeRun()
+    with patch("andrewaylett_pre_commit_hooks.uv_run.subprocess.run", fake):
+        run_uv_commands([["ruff"], ["ty"]], results=ResultCache(["*.py"]))
+        first = capsys.readouterr().out
+        run_uv_commands([["ruff"], ["ty"], ["pytest"]], results=ResultCache(["*.py"]))
+
+    assert fake.calls == 3
+    assert capsys.readouterr().out == first + "checked\n"
+
+
+def test_cache_is_bounded(project, tmp_path):
+    """Test that results are stored in a cache that can be evicted."""
+    cache = DiskCache("uv-run", max_bytes=0, directory=tmp_path / "results")
+    results = ResultCache(["*.py"], cache)
+    results.put(["pytest"], "out", "err")
+    assert results.get(["pytest"]) == {"stdout": "out", "stderr": "err"}
+
+    assert cache.evict() == 1
+    assert results.get(["pytest"]) is None
+
+
+@pytest.mark.parametrize("bypass", ["option", "environment"])
+def test_main_bypass(project, monkeypatch, bypass):
+    """Test that the cache can be bypassed explicitly."""
+    argv = ["pre-commit-uv-run", "--hook-cache-input", "*.py", "pytest"]
+    if bypass == "option":
+        argv.insert(1, "--hook-no-cache")
+    else:
+        monkeypatch.setenv("PRE_COMMIT_UV_RUN_NO_CACHE", "1")
+    monkeypatch.setattr("andrewaylett_pre_commit_hooks.uv_run.sys.argv", argv)
+    with patch(
+        "andrewaylett_pre_commit_hooks.uv_run.run_uv_command", return_value=True
+    ) as mock_run_uv_command:
+        main()
+
+    mock_run_uv_command.assert_called_once_with(["pytest"], use_exec=True)
+
+
+def test_main_uses_cache(project, monkeypatch):
+    """Test that main only runs a cached command once."""
+    monkeypatch.setattr(
+        "andrewaylett_pre_commit_hooks.uv_run.sys.argv",
+        ["pre-commit-uv-run", "--hook-cache-input=*.py", "pytest"],
+    )
+    fake = FakeRun()
+    with fake.patched():
+        main()
+        main()
+
+    assert fake.calls == 1
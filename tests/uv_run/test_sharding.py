@@ -0,0 +1,132 @@
+"""Tests for splitting filenames across several uv run commands."""
+
+from unittest.mock import patch
+
+import pytest
+
+from andrewaylett_pre_commit_hooks.uv_run import (
+    argument_budget,
+    main,
+    select_files,
+    shard_filenames,
+)
+
+
+def test_select_files_keeps_order():
+    """Test that matching files are kept in the order they were given."""
+    files = ["b.py", "docs/a.md", "a.py", "tests/test_a.py"]
+
+    assert select_files(files, ["*.py"]) == ["b.py", "a.py"]
+    assert select_files(files, ["**/*.py", "!tests/"]) == ["b.py", "a.py"]
+    assert select_files(files, []) == files
+
+
+def test_select_files_ignores_literals_not_given():
+    """Test that literal patterns don't add files that weren't passed."""
+    assert select_files(["a.py"], ["Makefile", "a.py"]) == ["a.py"]
+
+
+def test_shards_are_even():
+    """Test that files are spread evenly over the requested shards."""
+    files = [f"file{i}.py" for i in range(10)]
+    shards = shard_filenames(files, 4, budget=1 << 20)
+
+    assert [len(shard) for shard in shards] == [3, 3, 3, 1]
+    assert [file for shard in shards for file in shard] == files
+
+
+def test_shards_fit_the_budget():
+    """Test that no shard's arguments are larger than the budget."""
+    files = [f"{i:04d}" + "x" * 100 for i in range(100)]
+    budget = 1000
+    shards = shard_filenames(files, 1, budget)
+
+    assert len(shards) > 1
+    assert [file for shard in shards for file in shard] == files
+    for shard in shards:
+        assert sum(len(file) + 9 for file in shard) <= budget
+
+
+def test_no_more_shards_than_files():
+    """Test that there are never empty shards."""
+    assert shard_filenames(["a.py", "b.py"], 8, budget=1 << 20) == [
+        ["a.py"],
+        ["b.py"],
+    ]
+    assert shard_filenames([], 8, budget=1 << 20) == []
+
+
+def test_argument_budget_allows_for_environment(monkeypatch):
+    """Test that the budget shrinks as the environment and command grow."""
+    monkeypatch.setattr(
+        "andrewaylett_pre_commit_hooks.uv_run.os.sysconf", lambda name: 1 << 20
+    )
+    small = argument_budget([["ruff"]])
+    monkeypatch.setenv("LARGE_VARIABLE", "x" * 10000)
+
+    assert argument_budget([["ruff"]]) < small - 10000
+    assert argument_budget([["ruff"], ["x" * 1000]]) < argument_budget([["ruff"]])
+
+
+def run_main(monkeypatch, *argv):
+    monkeypatch.setattr(
+        "andrewaylett_pre_commit_hooks.uv_run.sys.argv", ["pre-commit-uv-run", *argv]
+    )
+    with patch(
+        "andrewaylett_pre_commit_hooks.uv_run.run_uv_commands", return_value=True
+    ) as mock_run_uv_commands:
+        main()
+    return mock_run_uv_commands
+
+
+def test_main_shards_each_command(monkeypatch):
+    """Test that every command runs on every shard of the matching files."""
+    mock_run_uv_commands = run_main(
+        monkeypatch,
+        "--hook-command=ruff check",
+        "--hook-command=ruff format --check",
+        "--hook-files=*.py",
+        "--hook-shard",
+        "--hook-jobs=2",
+        "a.py",
+        "b.md",
+        "c.py",
+        "d.py",
+    )
+
+    mock_run_uv_commands.assert_called_once_with(
+        [
+            ["ruff", "check", "a.py", "c.py"],
+            ["ruff", "check", "d.py"],
+            ["ruff", "format", "--check", "a.py", "c.py"],
+            ["ruff", "format", "--check", "d.py"],
+        ],
+        jobs=2,
+        results=None,
+    )
+
+
+def test_main_filters_without_sharding(monkeypatch):
+    """Test that files can be filtered without being split."""
+    mock_run_uv_commands = run_main(
+        monkeypatch, "--hook-command=mypy", "--hook-files=*.py", "a.py", "b.md", "c.py"
+    )
+
+    mock_run_uv_commands.assert_called_once_with(
+        [["mypy", "a.py", "c.py"]], jobs=None, results=None
+    )
+
+
+def test_main_with_no_matching_files(monkeypatch):
+    """Test that nothing runs when no files match."""
+    mock_run_uv_commands = run_main(
+        monkeypatch, "--hook-command=mypy", "--hook-files=*.py", "--hook-shard", "b.md"
+    )
+
+    mock_run_uv_commands.assert_not_called()
+
+
+def test_main_requires_commands(monkeypatch):
+    """Test that sharding needs commands, to tell them apart from filenames."""
+    with pytest.raises(SystemExit):
+        run_main(monkeypatch, "--hook-shard", "ruff", "a.py")
@@ -0,0 +1,109 @@
+"""Tests for streaming the output of commands the uv-run hook runs itself."""
+
+import io
+import sys
+import time
+import tracemalloc
+
+from andrewaylett_pre_commit_hooks.uv_run import OutputTail, stream_command
+
+
+class TimedStream(io.StringIO):
+    """A text-only stream that records when each write arrived."""
+
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+
+    def write(self, text):
+        self.writes.append((time.monotonic(), text))
+        return super().write(text)
+
+
+def python(script):
+    return [sys.executable, "-c", script]
+
+
+def test_tail_keeps_only_the_end():
+    """Test that the tail keeps at most its size, plus one chunk."""
+    tail = OutputTail(10)
+    for i in range(100):
+        tail.append(f"chunk {i:03d}\n".encode())
+
+    assert tail.text() == "chunk 099\n"
+    assert tail._size <= 10 + len("chunk 099\n")
+
+
+def test_tail_can_be_disabled():
+    """Test that a tail of no bytes keeps nothing."""
+    tail = OutputTail(0)
+    tail.append(b"output")
+
+    assert tail.text() == ""
+
+
+def test_tail_decodes_partial_characters():
+    """Test that a tail starting part-way through a character still decodes."""
+    tail = OutputTail(3)
+    tail.append("ééé".encode())
+
+    assert tail.text() == "�é"
+
+
+def test_output_is_streamed_as_it_arrives(monkeypatch):
+    """Test that output is passed on before the command exits."""
+    stdout = TimedStream()
+    monkeypatch.setattr(sys, "stdout", stdout)
+    script = "import sys, time; print('first', flush=True); time.sleep(0.5)"
+    returncode, _ = stream_command(python(script))
+    finished = time.monotonic()
+
+    assert returncode == 0
+    assert stdout.getvalue() == "first\n"
+    assert finished - stdout.writes[0][0] >= 0.4
+
+
+def test_text_streams_decode_incrementally(monkeypatch):
+    """Test that characters split across reads are decoded correctly."""
+    stdout = TimedStream()
+    stderr = io.StringIO()
+    monkeypatch.setattr(sys, "stdout", stdout)
+    monkeypatch.setattr(sys, "stderr", stderr)
+    script = (
+        "import sys, time\n"
+        "data = 'é'.encode()\n"
+        "sys.stdout.buffer.write(data[:1]); sys.stdout.flush(); time.sleep(0.1)\n"
+        "sys.stdout.buffer.write(data[1:]); sys.stderr.write('done')\n"
+    )
+    returncode, _ = stream_command(python(script))
+
+    assert returncode == 0
+    assert stdout.getvalue() == "é"
+    assert stderr.getvalue() == "done"
+
+
+def test_large_output_is_not_kept(capfd):
+    """Test that memory use doesn't grow with the size of the output."""
+    script = "import sys\nfor _ in range(1024): sys.stdout.write('x' * 16384)\n"
+    tracemalloc.start()
+    try:
+        returncode, tail = stream_command(python(script), tail_bytes=1024)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert returncode == 0
+    assert tail == "x" * 1024
+    assert len(capfd.readouterr().out) == 16 * 1024 * 1024
+    assert peak < 4 * 1024 * 1024
+
+
+def test_all_output_can_be_kept(capfd):
+    """Test that every chunk is kept when asked for."""
+    kept = ([], [])
+    script = "import sys; print('out'); print('err', file=sys.stderr); sys.exit(3)"
+    returncode, _ = stream_command(python(script), kept=kept)
+
+    assert returncode == 3
+    assert b"".join(kept[0]) == b"out\n"
+    assert b"".join(kept[1]) == b"err\n"
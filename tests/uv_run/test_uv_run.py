@@ -1,66 +1,73 @@
 """Unit tests for the uv-run hook."""
 
-from unittest.mock import MagicMock, patch
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
 
 from andrewaylett_pre_commit_hooks.uv_run import main, run_uv_command
 
 
+@pytest.fixture
+def without_uv():
+    """Run commands given to uv run directly, without uv.
+
+    Returns:
+        MagicMock: Records the commands that would have been run.
+    """
+    real_popen = subprocess.Popen
+
+    def popen(command, **kwargs):
+        return real_popen(command[2:], **kwargs)
+
+    with patch(
+        "andrewaylett_pre_commit_hooks.uv_run.subprocess.Popen", side_effect=popen
+    ) as mock_popen:
+        yield mock_popen
+
+
 def test_run_uv_command_no_args():
     """Test that run_uv_command returns False when no args are provided."""
     result = run_uv_command([])
     assert result is False
 
 
-@patch("andrewaylett_pre_commit_hooks.uv_run.subprocess.run")
-def test_run_uv_command_success(mock_run):
+def test_run_uv_command_success(without_uv, capfd):
     """Test that run_uv_command returns True when the command succeeds."""
-    # Mock the subprocess.run to return a successful result
-    mock_result = MagicMock()
-    mock_result.returncode = 0
-    mock_result.stdout = "Command output"
-    mock_result.stderr = ""
-    mock_run.return_value = mock_result
-
-    result = run_uv_command(["python", "-c", "print('Hello')"])
-
-    # Check that the command was called with the correct arguments
-    mock_run.assert_called_once_with(
-        ["uv", "run", "python", "-c", "print('Hello')"],
-        check=False,
-        capture_output=True,
-        text=True,
-    )
+    result = run_uv_command([sys.executable, "-c", "print('Hello')"])
+
+    # Check that the command was run with uv run, and its output passed on
+    assert without_uv.call_args.args[0] == [
+        "uv",
+        "run",
+        sys.executable,
+        "-c",
+        "print('Hello')",
+    ]
+    assert capfd.readouterr().out == "Hello\n"
 
     assert result is True
 
 
-@patch("andrewaylett_pre_commit_hooks.uv_run.subprocess.run")
-def test_run_uv_command_failure(mock_run):
+def test_run_uv_command_failure(without_uv, capfd, caplog):
     """Test that run_uv_command returns False when the command fails."""
-    # Mock the subprocess.run to return a failed result
-    mock_result = MagicMock()
-    mock_result.returncode = 1
-    mock_result.stdout = ""
-    mock_result.stderr = "Error message"
-    mock_run.return_value = mock_result
-
-    result = run_uv_command(["python", "-c", "import sys; sys.exit(1)"])
-
-    # Check that the command was called with the correct arguments
-    mock_run.assert_called_once_with(
-        ["uv", "run", "python", "-c", "import sys; sys.exit(1)"],
-        check=False,
-        capture_output=True,
-        text=True,
+    result = run_uv_command(
+        [sys.executable, "-c", "import sys; sys.exit('Error message')"]
     )
 
+    # Check that the command's error was passed on, and repeated in the log
+    assert capfd.readouterr().err == "Error message\n"
+    assert "Command failed with exit code 1" in caplog.text
+    assert "Error message" in caplog.text
+
     assert result is False
 
 
-@patch("andrewaylett_pre_commit_hooks.uv_run.subprocess.run")
+@patch("andrewaylett_pre_commit_hooks.uv_run.subprocess.Popen")
 def test_run_uv_command_exception(mock_run):
     """Test that run_uv_command returns False when an exception occurs."""
-    # Mock the subprocess.run to raise an exception
+    # Mock the subprocess.Popen to raise an exception
     mock_run.side_effect = Exception("Command failed")
 
     result = run_uv_command(["python", "-c", "print('Hello')"])